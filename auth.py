@@ -75,11 +75,13 @@ class RecoveryProtection:
 
 
 class SecureAuthManager:
-    def __init__(self, config_path='data/vault_config.json'):
+    def __init__(self, config_path='data/vault_config.json', kdf_iterations=300000,
+                 recovery_answer_rounds=12):
         self.config_path = config_path
         self.config = self._load_config()
         self._password_regex_cache = None
-        self._kdf_iterations = 300000
+        self._kdf_iterations = kdf_iterations
+        self._recovery_answer_rounds = recovery_answer_rounds
         self._recovery_protection = RecoveryProtection()
         self._lock = threading.RLock()
         
@@ -191,8 +193,7 @@ class SecureAuthManager:
         for question, answer in (recovery_questions or []):
             # Добавляем соль для каждого ответа
             answer_salt = secrets.token_bytes(16)
-            answer_with_salt = answer.encode() + answer_salt
-            answer_hash = bcrypt.hashpw(answer_with_salt, bcrypt.gensalt()).decode()
+            answer_hash = self._hash_recovery_answer(answer, answer_salt)
             encrypted_recovery_answers.append({
                 'question': question, 
                 'answer_hash': answer_hash,
@@ -241,6 +242,12 @@ class SecureAuthManager:
         encrypted_data = fernet.encrypt(data)
         return master_salt + encrypted_data
     
+    def _hash_recovery_answer(self, answer, answer_salt):
+        """Хеш bcrypt ответа на вопрос восстановления с учетом соли"""
+        answer_with_salt = answer.encode() + answer_salt
+        salt = bcrypt.gensalt(rounds=self._recovery_answer_rounds)
+        return bcrypt.hashpw(answer_with_salt, salt).decode()
+    
     def _derive_strong_recovery_key(self, answers_string, salt):
         """Создание усиленного ключа восстановления"""
         # Дополнительный хеш для увеличения энтропии
@@ -415,8 +422,7 @@ class SecureAuthManager:
         encrypted_recovery_answers = []
         for question, answer in recovery_questions:
             answer_salt = secrets.token_bytes(16)
-            answer_with_salt = answer.encode() + answer_salt
-            answer_hash = bcrypt.hashpw(answer_with_salt, bcrypt.gensalt()).decode()
+            answer_hash = self._hash_recovery_answer(answer, answer_salt)
             encrypted_recovery_answers.append({
                 'question': question, 
                 'answer_hash': answer_hash,
@@ -487,8 +493,8 @@ class SecureAuthManager:
     def verify_recovery_answers(self, answers):
         """Проверка ответов на вопросы восстановления с улучшенной безопасностью"""
         stored_questions = self.config.get('recovery_questions', [])
-        if len(answers) != len(stored_questions):
-            return False
+        # Принимаем любой итерируемый объект пар (вопрос, ответ), не только список
+        answers = iter(answers)
         
         user_id = self.config.get('user_id', 'default')
         
@@ -500,9 +506,15 @@ class SecureAuthManager:
         result = True
         
         try:
-            for i, (question, answer) in enumerate(answers):
+            for stored_data in stored_questions:
+                pair = next(answers, None)
+                if pair is None:
+                    # Ответов меньше, чем вопросов
+                    result = False
+                    break
+                
+                question, answer = pair
                 try:
-                    stored_data = stored_questions[i]
                     stored_answer_hash = stored_data['answer_hash'].encode()
                     answer_salt = base64.b64decode(stored_data['salt'])
                     
@@ -516,6 +528,10 @@ class SecureAuthManager:
                     result = False
                     break
             
+            # Ответов больше, чем вопросов
+            if result and next(answers, None) is not None:
+                result = False
+            
             if not result:
                 self._recovery_protection.record_attempt(user_id)
             
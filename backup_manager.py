@@ -3,87 +3,177 @@ import os
 import json
 import shutil
 import logging
+import mmap
+import sys
 import threading
 import hashlib
+import heapq
 import tempfile
 import time
 import zipfile
 from datetime import datetime, timedelta
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, NamedTuple, Optional, Tuple, Union
 from cryptography.fernet import Fernet
 
 from securestring import SecureString
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Размер буфера чтения при хэшировании бэкапов (1 МиБ)
+_HASH_BUFFER_SIZE = 1024 * 1024
+
+# На 32-битных системах большие файлы не отображаем в память целиком
+_MMAP_HASH_LIMIT = sys.maxsize if sys.maxsize > 2 ** 32 else 2 * 1024 ** 3
+
+# Секунд в сутках
+_SECONDS_PER_DAY = 24 * 3600
+
+# Зашифрованные файлы хранилища не сжимаются: шифротекст неотличим от случайных данных
+_ENCRYPTED_SUFFIXES = ('.myarc', '.enc')
+
+
+def _dumps_manifest(manifest: Dict) -> bytes:
+    """Компактная сериализация манифеста в UTF-8"""
+    if orjson is not None:
+        return orjson.dumps(manifest)
+    return json.dumps(manifest, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class BackupInfo(NamedTuple):
+    """Краткая запись о бэкапе для стратегии хранения"""
+    path: str
+    created_at: Union[datetime, int, float]
+
 
 class BackupStrategy:
     """Стратегия резервного копирования"""
     
-    def __init__(self, max_backups: int = 10, retention_days: int = 30):
+    def __init__(self, max_backups: int = 10, retention_days: int = 30,
+                 clock: Callable[[], float] = time.time):
         self.max_backups = max_backups
         self.retention_days = retention_days
+        self._clock = clock
         self._lock = threading.RLock()
     
+    def _now(self) -> int:
+        """Текущее время в целых секундах UNIX"""
+        return int(self._clock())
+    
+    @staticmethod
+    def _to_timestamp(value) -> int:
+        """Приведение времени бэкапа к целым секундам UNIX"""
+        if isinstance(value, datetime):
+            return int(value.timestamp())
+        return int(value)
+    
     def should_create_backup(self, last_backup_time: Optional[datetime]) -> bool:
         """Определение необходимости создания бэкапа"""
         if last_backup_time is None:
             return True
         
         # Минимум 1 бэкап в день
-        time_since_last = datetime.now() - last_backup_time
-        return time_since_last >= timedelta(days=1)
+        time_since_last = self._now() - self._to_timestamp(last_backup_time)
+        return time_since_last >= _SECONDS_PER_DAY
+    
+    @classmethod
+    def _stamp_backup(cls, backup: Union[BackupInfo, Dict]) -> Tuple[int, str]:
+        """Время создания и путь бэкапа из записи или словаря метаданных"""
+        if isinstance(backup, BackupInfo):
+            return cls._to_timestamp(backup.created_at), backup.path
+        return cls._to_timestamp(backup['created_at']), backup['path']
     
-    def get_backups_to_delete(self, backups: List[Dict]) -> List[str]:
+    def get_backups_to_delete(self, backups: List[Union[BackupInfo, Dict]]) -> List[str]:
         """Определение бэкапов для удаления"""
         with self._lock:
-            if len(backups) <= self.max_backups:
-                return []
+            # Время создания в целых секундах - сравнения без объектов datetime
+            stamped = [self._stamp_backup(backup) for backup in backups]
             
-            # Сортируем по дате создания (старые сначала)
-            sorted_backups = sorted(backups, key=lambda x: x['created_at'])
+            # Удаляем бэкапы старше retention_days независимо от их количества
+            cutoff = self._now() - self.retention_days * _SECONDS_PER_DAY
+            to_delete = [path for created_at, path in stamped if created_at < cutoff]
+            kept = [item for item in stamped if item[0] >= cutoff]
             
-            # Удаляем старые сверх лимита
-            to_delete = []
-            for i in range(len(sorted_backups) - self.max_backups):
-                to_delete.append(sorted_backups[i]['path'])
+            # Из оставшихся удаляем самые старые сверх лимита (полная сортировка не нужна)
+            excess = len(kept) - self.max_backups
+            if excess > 0:
+                to_delete.extend(path for _, path in heapq.nsmallest(excess, kept, key=itemgetter(0)))
             
-            # Также удаляем бэкапы старше retention_days
-            cutoff_date = datetime.now() - timedelta(days=self.retention_days)
-            for backup in sorted_backups:
-                if backup['created_at'] < cutoff_date:
-                    to_delete.append(backup['path'])
-            
-            return list(set(to_delete))
+            return to_delete
     
     def get_recommended_backup_time(self) -> datetime:
         """Рекомендуемое время для следующего бэкапа"""
-        return datetime.now() + timedelta(hours=6)  # Каждые 6 часов
+        return datetime.fromtimestamp(self._now() + 6 * 3600)  # Каждые 6 часов
 
 
 class BackupIntegrityChecker:
     """Проверка целостности бэкапов"""
     
+    # Обязательные файлы в архиве бэкапа
+    REQUIRED_MEMBERS = frozenset({
+        'manifest.json',
+        'filesystem.json.enc',
+        'vault_config.json'
+    })
+    
     @staticmethod
     def calculate_backup_hash(backup_path: str) -> str:
         """Вычисление хэша бэкапа"""
-        sha256_hash = hashlib.sha256()
-        
-        with open(backup_path, 'rb') as f:
-            # Читаем файл по частям для экономии памяти
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
+        # Хэш всегда считается по содержимому: кэш по mtime/размеру пропустил бы
+        # повреждение, не меняющее этих атрибутов
+        # hashlib использует OpenSSL, который сам выбирает аппаратное ускорение SHA
+        with open(backup_path, 'rb', buffering=0) as f:
+            # Отображаем файл в память и хэшируем его одним вызовом без промежуточных буферов
+            file_size = os.fstat(f.fileno()).st_size
+            if 0 < file_size <= _MMAP_HASH_LIMIT:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return hashlib.sha256(mapped).hexdigest()
+            
+            # Python 3.11+: цикл чтения и обновления хэша выполняется в C
+            if hasattr(hashlib, 'file_digest'):
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            
+            # Читаем файл по частям в один переиспользуемый буфер
+            sha256_hash = hashlib.sha256()
+            buffer = bytearray(_HASH_BUFFER_SIZE)
+            view = memoryview(buffer)
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                sha256_hash.update(view[:size])
         
         return sha256_hash.hexdigest()
     
     @staticmethod
-    def verify_backup_integrity(backup_path: str, expected_hash: str) -> bool:
+    def verify_backup_integrity(backup_path: str, expected_hash: str,
+                                expected_size: Optional[int] = None) -> bool:
         """Проверка целостности бэкапа"""
         if not os.path.exists(backup_path):
             return False
         
+        # Несовпадение размера (например, обрезанный файл) видно без чтения содержимого
+        if expected_size is not None and os.path.getsize(backup_path) != expected_size:
+            return False
+        
         actual_hash = BackupIntegrityChecker.calculate_backup_hash(backup_path)
         return actual_hash == expected_hash
     
+    @staticmethod
+    def quick_verify(backup_path: str) -> List[str]:
+        """Быстрая проверка архива по CRC-32 записей (без SHA-256)"""
+        try:
+            with zipfile.ZipFile(backup_path, 'r') as zip_ref:
+                bad_file = zip_ref.testzip()
+        except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+            return [f"Архив поврежден: {e}"]
+        
+        return [f"Поврежденные файлы в архиве: {bad_file}"] if bad_file else []
+    
     @staticmethod
     def check_backup_structure(backup_path: str) -> List[str]:
         """Проверка структуры бэкапа"""
@@ -92,15 +182,9 @@ class BackupIntegrityChecker:
         try:
             with zipfile.ZipFile(backup_path, 'r') as zip_ref:
                 # Проверяем обязательные файлы
-                required_files = [
-                    'manifest.json',
-                    'filesystem.json.enc',
-                    'vault_config.json'
-                ]
-                
-                for required_file in required_files:
-                    if required_file not in zip_ref.namelist():
-                        issues.append(f"Отсутствует обязательный файл: {required_file}")
+                missing_files = BackupIntegrityChecker.REQUIRED_MEMBERS.difference(zip_ref.namelist())
+                for required_file in sorted(missing_files):
+                    issues.append(f"Отсутствует обязательный файл: {required_file}")
                 
                 # Проверяем целостность архива
                 bad_files = zip_ref.testzip()
@@ -151,8 +235,8 @@ class BackupCreator:
                     # 4. Создаем манифест
                     manifest = self._create_manifest(vault_core, backup_type, timestamp)
                     manifest_path = os.path.join(temp_dir, 'manifest.json')
-                    with open(manifest_path, 'w', encoding='utf-8') as f:
-                        json.dump(manifest, f, indent=2, ensure_ascii=False)
+                    with open(manifest_path, 'wb') as f:
+                        f.write(_dumps_manifest(manifest))
                     
                     # 5. Создаем зашифрованный архив
                     success = self._create_encrypted_archive(
@@ -253,7 +337,9 @@ class BackupCreator:
                     for file in files:
                         file_path = os.path.join(root, file)
                         arcname = os.path.relpath(file_path, temp_dir)
-                        zipf.write(file_path, arcname)
+                        compress_type = (zipfile.ZIP_STORED if file.endswith(_ENCRYPTED_SUFFIXES)
+                                         else zipfile.ZIP_DEFLATED)
+                        zipf.write(file_path, arcname, compress_type)
             
             # Вычисляем хэш архива
             with open(temp_zip, 'rb') as f:
@@ -313,8 +399,7 @@ class BackupCreator:
                     for item in zip_in.infolist():
                         if item.filename == 'manifest.json':
                             # Записываем обновленный манифест
-                            manifest_data = json.dumps(manifest, ensure_ascii=False).encode()
-                            zip_out.writestr(item, manifest_data)
+                            zip_out.writestr(item, _dumps_manifest(manifest))
                         else:
                             # Копируем как есть
                             data = zip_in.read(item.filename)
@@ -458,7 +543,10 @@ class BackupRestorer:
             fs_dest = os.path.join('data', 'filesystem.json.enc')
             
             if os.path.exists(fs_source):
-                shutil.copy2(fs_source, fs_dest)
+                # Замена, а не запись поверх: текущий файл может быть жесткой ссылкой на бэкап
+                fs_temp = fs_dest + '.restore'
+                shutil.copy2(fs_source, fs_temp)
+                os.replace(fs_temp, fs_dest)
             else:
                 return False, "Файловая система не найдена в бэкапе"
             
@@ -495,8 +583,11 @@ class BackupRestorer:
                 if os.path.exists(fs_dest):
                     shutil.copy2(fs_dest, backup_path)
                 
-                # Восстанавливаем
-                shutil.copy2(fs_source, fs_dest)
+                # Восстанавливаем заменой, а не записью поверх: текущий файл
+                # может быть жесткой ссылкой на бэкап
+                fs_temp = fs_dest + '.restore'
+                shutil.copy2(fs_source, fs_temp)
+                os.replace(fs_temp, fs_dest)
                 
                 return True, f"Файловая система восстановлена. Предыдущая сохранена как {backup_path}"
             else:
@@ -673,7 +764,7 @@ class BackupManager:
         
         # Проверяем целостность
         if not self.integrity_checker.verify_backup_integrity(
-            backup_path, metadata['hash']
+            backup_path, metadata['hash'], metadata.get('size')
         ):
             return False, ["Хэш бэкапа не совпадает"]
         
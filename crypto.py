@@ -9,12 +9,79 @@ import threading
 from typing import Optional, Callable
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.poly1305 import Poly1305
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
 
 # Импортируем нашу безопасную реализацию
 from securestring import SecureString, SecureTempFile
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Сигнатура формата файлов AES-GCM (файлы без сигнатуры - прежний формат Fernet)
+_AESGCM_FILE_MAGIC = b'MYA\x02'
+_AESGCM_NONCE_SIZE = 12
+
+# Потоковый формат больших файлов: AES-256-CTR + Poly1305 (encrypt-then-MAC)
+_STREAM_FILE_MAGIC = b'MYA\x03'
+_STREAM_NONCE_SIZE = 16
+_STREAM_TAG_SIZE = 16
+_STREAM_CHUNK_SIZE = 1024 * 1024
+_STREAM_KDF_INFO = b'myarc stream v3'
+
+# Размер буфера чтения при хэшировании файлов (1 МиБ)
+_HASH_BUFFER_SIZE = 1024 * 1024
+
+# Ключ контроля целостности зашифрованных файлов выводится из мастер-ключа
+_FILE_MAC_KDF_INFO = b'myarc file mac v1'
+_FILE_MAC_SIZE = 32
+
+
+def _update_hash_from_file(hash_func, f):
+    """Хэширование файла по частям через один переиспользуемый буфер"""
+    buffer = bytearray(_HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    while True:
+        size = f.readinto(buffer)
+        if not size:
+            break
+        hash_func.update(view[:size])
+    return hash_func
+
+
+def has_hardware_aes() -> Optional[bool]:
+    """Проверка аппаратной поддержки AES процессором (None - определить не удалось)"""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                # x86: строка flags, ARM: строка Features
+                if line.startswith(('flags', 'Features')):
+                    return 'aes' in line.split(':', 1)[1].split()
+    except OSError:
+        pass
+    return None
+
+
+_HARDWARE_AES_CHECKED = False
+
+
+def _warn_if_no_hardware_aes():
+    """Однократное предупреждение при первом шифровании файла на процессоре без аппаратного AES"""
+    global _HARDWARE_AES_CHECKED
+    if _HARDWARE_AES_CHECKED:
+        return
+    _HARDWARE_AES_CHECKED = True
+    # AES выполняется в OpenSSL, который сам использует AES-NI при его наличии
+    if has_hardware_aes() is False:
+        logging.warning("Процессор не поддерживает аппаратный AES, шифрование файлов будет медленнее")
+
 
 class SecureKeyContainer:
     """Безопасный контейнер для хранения ключей в памяти"""
@@ -78,6 +145,7 @@ class SecureCryptoManager:
         self._chunk_size = 64 * 1024
         self._kdf_iterations = 300000
         self._key_lock = threading.RLock()
+        self._file_mac_key = None
         
         # Очистка мастер-ключа из входных данных
         if isinstance(master_key, (bytes, bytearray)):
@@ -89,10 +157,12 @@ class SecureCryptoManager:
     
     def _secure_erase(self, data):
         """Безопасное затирание данных в памяти"""
-        if isinstance(data, (bytes, bytearray)):
-            mutable = bytearray(data)
-            for i in range(len(mutable)):
-                mutable[i] = secrets.randbits(8)
+        if isinstance(data, bytearray):
+            # Перезаписываем сам буфер одним вызовом, а не его копию побайтно
+            data[:] = secrets.token_bytes(len(data))
+        elif isinstance(data, bytes):
+            # Неизменяемые bytes перезаписать нельзя: копия не затирает оригинал
+            pass
         elif isinstance(data, str):
             # Для строк используем SecureString
             secure_str = SecureString(data)
@@ -104,6 +174,9 @@ class SecureCryptoManager:
             self._master_key_container.secure_clear()
         
         with self._key_lock:
+            if getattr(self, '_file_mac_key', None):
+                self._file_mac_key.secure_clear()
+                self._file_mac_key = None
             for key_container in self._active_keys.values():
                 key_container.secure_clear()
             self._active_keys.clear()
@@ -158,31 +231,36 @@ class SecureCryptoManager:
             if decryption_key and not key_id:
                 self._secure_erase(decryption_key)
     
-    def encrypt_file(self, file_path, folder_key=None, progress_callback: Optional[Callable] = None):
-        """Безопасное шифрование файла"""
+    def encrypt_file(self, file_path, folder_key=None, progress_callback: Optional[Callable] = None,
+                     sync=True, with_hash=False):
+        """Безопасное шифрование файла (with_hash=True - также SHA-256 исходных данных)"""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Файл не найден: {file_path}")
         
+        _warn_if_no_hardware_aes()
         file_size = os.path.getsize(file_path)
         
         if file_size > 10 * 1024 * 1024:
-            return self.encrypt_large_file(file_path, folder_key, progress_callback)
+            return self.encrypt_large_file(file_path, folder_key, progress_callback, sync, with_hash)
         
-        file_key = Fernet.generate_key()
-        file_fernet = Fernet(file_key)
+        file_key = AESGCM.generate_key(bit_length=256)
         
         try:
             with open(file_path, 'rb') as f:
                 file_data = f.read()
             
-            encrypted_data = file_fernet.encrypt(file_data)
-            
             # Шифруем ключ файла
-            if folder_key:
-                folder_fernet = Fernet(folder_key)
-                encrypted_file_key = folder_fernet.encrypt(file_key)
-            else:
-                encrypted_file_key = self.encrypt_data(file_key)
+            encrypted_file_key = self._encrypt_file_key(file_key, folder_key)
+            
+            # Заголовок аутентифицируется вместе с данными
+            nonce = os.urandom(_AESGCM_NONCE_SIZE)
+            header = (
+                _AESGCM_FILE_MAGIC +
+                len(encrypted_file_key).to_bytes(4, 'big') +
+                encrypted_file_key +
+                nonce
+            )
+            encrypted_data = AESGCM(file_key).encrypt(nonce, file_data, header)
             
             # Создаем безопасное имя файла
             file_id = secrets.token_hex(16)
@@ -194,11 +272,7 @@ class SecureCryptoManager:
             # Используем безопасный временный файл
             with SecureTempFile(prefix='enc_', suffix='.myarc', 
                               directory=os.path.dirname(vault_filename)) as temp_file:
-                temp_file.write_secure(
-                    len(encrypted_file_key).to_bytes(4, 'big') + 
-                    encrypted_file_key + 
-                    encrypted_data
-                )
+                temp_file.write_secure(header + encrypted_data, sync)
                 
                 # Атомарная замена с блокировкой
                 import time
@@ -219,6 +293,8 @@ class SecureCryptoManager:
             if progress_callback:
                 progress_callback(100)
             
+            if with_hash:
+                return vault_filename, file_id, hashlib.sha256(file_data).hexdigest()
             return vault_filename, file_id
             
         except Exception as e:
@@ -232,21 +308,21 @@ class SecureCryptoManager:
             if 'file_data' in locals():
                 self._secure_erase(file_data)
     
-    def encrypt_large_file(self, file_path, folder_key=None, progress_callback: Optional[Callable] = None):
-        """Безопасное шифрование больших файлов"""
-        file_key = Fernet.generate_key()
-        file_fernet = Fernet(file_key)
+    def encrypt_large_file(self, file_path, folder_key=None, progress_callback: Optional[Callable] = None,
+                           sync=True, with_hash=False):
+        """Безопасное шифрование больших файлов (sync=False - синхронизацию выполняет вызывающий)"""
+        _warn_if_no_hardware_aes()
+        file_key = secrets.token_bytes(32)
+        
+        # Хэш исходных данных считается в том же проходе, что и шифрование
+        hasher = hashlib.sha256() if with_hash else None
         
         file_id = secrets.token_hex(16)
         vault_filename = f"data/encrypted_files/{file_id}.myarc"
         
         try:
             # Шифруем ключ файла
-            if folder_key:
-                folder_fernet = Fernet(folder_key)
-                encrypted_file_key = folder_fernet.encrypt(file_key)
-            else:
-                encrypted_file_key = self.encrypt_data(file_key)
+            encrypted_file_key = self._encrypt_file_key(file_key, folder_key)
             
             total_size = os.path.getsize(file_path)
             processed = 0
@@ -254,28 +330,46 @@ class SecureCryptoManager:
             # Создаем директорию если нужно
             os.makedirs(os.path.dirname(vault_filename), exist_ok=True)
             
+            nonce = os.urandom(_STREAM_NONCE_SIZE)
+            header = (
+                _STREAM_FILE_MAGIC +
+                len(encrypted_file_key).to_bytes(4, 'big') +
+                encrypted_file_key +
+                nonce
+            )
+            
+            # Один контекст шифра на весь файл, MAC покрывает заголовок и шифротекст
+            encryptor, mac = self._create_stream_cipher(file_key, nonce, encrypt=True)
+            mac.update(header)
+            
             with SecureTempFile(prefix='enc_large_', suffix='.myarc',
                               directory=os.path.dirname(vault_filename)) as temp_file:
                 
                 # Записываем заголовок с ключом
-                header = len(encrypted_file_key).to_bytes(4, 'big') + encrypted_file_key
-                temp_file.write_secure(header)
+                temp_file.write_secure(header, sync)
                 
-                # Шифруем файл по частям
+                # Шифруем файл по частям через заранее выделенные буферы
+                in_view, out_view = self._allocate_stream_buffers()
                 with open(file_path, 'rb') as infile:
                     with open(temp_file.path, 'ab') as outfile:
                         while True:
-                            chunk = infile.read(self._chunk_size)
-                            if not chunk:
+                            size = infile.readinto(in_view)
+                            if not size:
                                 break
                             
-                            encrypted_chunk = file_fernet.encrypt(chunk)
-                            outfile.write(encrypted_chunk)
+                            if hasher:
+                                hasher.update(in_view[:size])
+                            written = encryptor.update_into(in_view[:size], out_view)
+                            mac.update(out_view[:written])
+                            outfile.write(out_view[:written])
                             
-                            processed += len(chunk)
+                            processed += size
                             if progress_callback:
                                 progress = (processed / total_size) * 100
                                 progress_callback(progress)
+                        
+                        outfile.write(encryptor.finalize())
+                        outfile.write(mac.finalize())
                 
                 # Атомарная замена
                 if os.path.exists(vault_filename):
@@ -291,8 +385,51 @@ class SecureCryptoManager:
         finally:
             self._secure_erase(file_key)
         
+        if hasher:
+            return vault_filename, file_id, hasher.hexdigest()
         return vault_filename, file_id
     
+    @staticmethod
+    def _allocate_stream_buffers():
+        """Буферы чтения и вывода шифра для потокового формата"""
+        # update_into требует запас в блок шифра сверх размера входных данных
+        out_size = _STREAM_CHUNK_SIZE + algorithms.AES.block_size // 8 - 1
+        return memoryview(bytearray(_STREAM_CHUNK_SIZE)), memoryview(bytearray(out_size))
+    
+    @staticmethod
+    def _create_stream_cipher(file_key, nonce, encrypt):
+        """Контекст AES-CTR и Poly1305 потокового формата"""
+        # Ключи шифрования и MAC выводятся из одноразового ключа файла
+        derived = HKDF(
+            algorithm=hashes.SHA256(),
+            length=64,
+            salt=None,
+            info=_STREAM_KDF_INFO
+        ).derive(file_key)
+        
+        cipher = Cipher(algorithms.AES(derived[:32]), modes.CTR(nonce))
+        context = cipher.encryptor() if encrypt else cipher.decryptor()
+        return context, Poly1305(derived[32:])
+    
+    def _encrypt_file_key(self, file_key, folder_key=None):
+        """Шифрование ключа файла ключом папки или мастер-ключом"""
+        if folder_key:
+            return Fernet(folder_key).encrypt(file_key)
+        return self.encrypt_data(file_key)
+    
+    def _decrypt_file_key(self, encrypted_file_key, folder_key=None):
+        """Дешифрование ключа файла ключом папки или мастер-ключом"""
+        if folder_key:
+            return Fernet(folder_key).decrypt(encrypted_file_key)
+        return self.decrypt_data(encrypted_file_key)
+    
+    @staticmethod
+    def _read_file_format(vault_file_path):
+        """Сигнатура формата зашифрованного файла (None - прежний формат Fernet)"""
+        with open(vault_file_path, 'rb') as f:
+            magic = f.read(len(_AESGCM_FILE_MAGIC))
+        return magic if magic in (_AESGCM_FILE_MAGIC, _STREAM_FILE_MAGIC) else None
+    
     def _secure_delete_file(self, file_path):
         """Безопасное удаление файла с перезаписью"""
         try:
@@ -312,31 +449,42 @@ class SecureCryptoManager:
             except:
                 pass
     
-    def decrypt_file(self, vault_file_path, output_path, folder_key=None, progress_callback: Optional[Callable] = None):
-        """Безопасное дешифрование файла"""
+    def decrypt_file(self, vault_file_path, output_path, folder_key=None, progress_callback: Optional[Callable] = None,
+                     with_hash=False):
+        """Безопасное дешифрование файла (with_hash=True - возвращает SHA-256 результата)"""
         if not os.path.exists(vault_file_path):
             raise FileNotFoundError(f"Зашифрованный файл не найден: {vault_file_path}")
         
         file_size = os.path.getsize(vault_file_path)
+        file_format = self._read_file_format(vault_file_path)
         
-        if file_size > 10 * 1024 * 1024:
-            return self.decrypt_large_file(vault_file_path, output_path, folder_key, progress_callback)
+        # Файлы прежнего формата различаются по размеру
+        if file_format == _STREAM_FILE_MAGIC or (file_format is None and file_size > 10 * 1024 * 1024):
+            return self.decrypt_large_file(vault_file_path, output_path, folder_key, progress_callback, with_hash)
         
         try:
             with open(vault_file_path, 'rb') as f:
+                if file_format is not None:
+                    f.read(len(file_format))
                 key_length = int.from_bytes(f.read(4), 'big')
                 encrypted_file_key = f.read(key_length)
+                if file_format == _AESGCM_FILE_MAGIC:
+                    nonce = f.read(_AESGCM_NONCE_SIZE)
                 encrypted_data = f.read()
             
             # Дешифруем ключ файла
-            if folder_key:
-                folder_fernet = Fernet(folder_key)
-                file_key = folder_fernet.decrypt(encrypted_file_key)
-            else:
-                file_key = self.decrypt_data(encrypted_file_key)
+            file_key = self._decrypt_file_key(encrypted_file_key, folder_key)
             
-            file_fernet = Fernet(file_key)
-            decrypted_data = file_fernet.decrypt(encrypted_data)
+            if file_format == _AESGCM_FILE_MAGIC:
+                header = (
+                    _AESGCM_FILE_MAGIC +
+                    key_length.to_bytes(4, 'big') +
+                    encrypted_file_key +
+                    nonce
+                )
+                decrypted_data = AESGCM(file_key).decrypt(nonce, encrypted_data, header)
+            else:
+                decrypted_data = Fernet(file_key).decrypt(encrypted_data)
             
             # Безопасная запись во временный файл
             with SecureTempFile(prefix='dec_', suffix='.tmp', 
@@ -358,6 +506,9 @@ class SecureCryptoManager:
                 
             if progress_callback:
                 progress_callback(100)
+            
+            if with_hash:
+                return hashlib.sha256(decrypted_data).hexdigest()
                 
         except Exception as e:
             # Безопасная очистка при ошибке
@@ -371,10 +522,91 @@ class SecureCryptoManager:
             if 'decrypted_data' in locals():
                 self._secure_erase(decrypted_data)
     
-    def decrypt_large_file(self, vault_file_path, output_path, folder_key=None, progress_callback: Optional[Callable] = None):
-        """Безопасное дешифрование больших файлов"""
+    def decrypt_large_file(self, vault_file_path, output_path, folder_key=None, progress_callback: Optional[Callable] = None,
+                           with_hash=False):
+        """Безопасное дешифрование больших файлов (with_hash=True - возвращает SHA-256 результата)"""
+        if self._read_file_format(vault_file_path) != _STREAM_FILE_MAGIC:
+            return self._decrypt_fernet_large_file(
+                vault_file_path, output_path, folder_key, progress_callback, with_hash
+            )
+        
+        total_size = os.path.getsize(vault_file_path)
+        hasher = hashlib.sha256() if with_hash else None
+        
+        try:
+            with open(vault_file_path, 'rb') as infile:
+                # Читаем заголовок с зашифрованным ключом
+                magic = infile.read(len(_STREAM_FILE_MAGIC))
+                key_length_bytes = infile.read(4)
+                encrypted_file_key = infile.read(int.from_bytes(key_length_bytes, 'big'))
+                nonce = infile.read(_STREAM_NONCE_SIZE)
+                header = magic + key_length_bytes + encrypted_file_key + nonce
+                
+                remaining = total_size - len(header) - _STREAM_TAG_SIZE
+                if len(nonce) != _STREAM_NONCE_SIZE or remaining < 0:
+                    raise ValueError("Ошибка дешифрования: файл поврежден")
+                
+                # Дешифруем ключ файла
+                file_key = self._decrypt_file_key(encrypted_file_key, folder_key)
+                decryptor, mac = self._create_stream_cipher(file_key, nonce, encrypt=False)
+                mac.update(header)
+                processed = len(header)
+                
+                # Безопасный временный файл для вывода
+                with SecureTempFile(prefix='dec_large_', suffix='.tmp',
+                                  directory=os.path.dirname(output_path)) as temp_file:
+                    
+                    in_view, out_view = self._allocate_stream_buffers()
+                    with open(temp_file.path, 'wb') as outfile:
+                        while remaining > 0:
+                            size = infile.readinto(in_view[:min(_STREAM_CHUNK_SIZE, remaining)])
+                            if not size:
+                                raise ValueError("Ошибка дешифрования: файл обрезан")
+                            
+                            mac.update(in_view[:size])
+                            written = decryptor.update_into(in_view[:size], out_view)
+                            if hasher:
+                                hasher.update(out_view[:written])
+                            outfile.write(out_view[:written])
+                            remaining -= size
+                            
+                            processed += size
+                            if progress_callback:
+                                progress = (processed / total_size) * 100
+                                progress_callback(progress)
+                        
+                        tail = decryptor.finalize()
+                        if hasher:
+                            hasher.update(tail)
+                        outfile.write(tail)
+                    
+                    # Результат публикуется только после проверки MAC
+                    try:
+                        mac.verify(infile.read(_STREAM_TAG_SIZE))
+                    except InvalidSignature:
+                        raise ValueError("Ошибка дешифрования: файл поврежден или изменен")
+                    
+                    # Атомарная замена
+                    os.replace(temp_file.path, output_path)
+                    temp_file.path = None
+                            
+        except Exception as e:
+            if os.path.exists(output_path):
+                self._secure_delete_file(output_path)
+            raise e
+        finally:
+            if 'file_key' in locals():
+                self._secure_erase(file_key)
+        
+        if hasher:
+            return hasher.hexdigest()
+    
+    def _decrypt_fernet_large_file(self, vault_file_path, output_path, folder_key=None,
+                                   progress_callback: Optional[Callable] = None, with_hash=False):
+        """Дешифрование больших файлов прежнего формата Fernet"""
         total_size = os.path.getsize(vault_file_path)
         processed = 0
+        hasher = hashlib.sha256() if with_hash else None
         
         try:
             with open(vault_file_path, 'rb') as infile:
@@ -384,11 +616,7 @@ class SecureCryptoManager:
                 processed += 4 + key_length
                 
                 # Дешифруем ключ файла
-                if folder_key:
-                    folder_fernet = Fernet(folder_key)
-                    file_key = folder_fernet.decrypt(encrypted_file_key)
-                else:
-                    file_key = self.decrypt_data(encrypted_file_key)
+                file_key = self._decrypt_file_key(encrypted_file_key, folder_key)
                 
                 file_fernet = Fernet(file_key)
                 
@@ -404,6 +632,8 @@ class SecureCryptoManager:
                             
                             try:
                                 decrypted_chunk = file_fernet.decrypt(chunk)
+                                if hasher:
+                                    hasher.update(decrypted_chunk)
                                 outfile.write(decrypted_chunk)
                             except Exception as e:
                                 raise ValueError(f"Ошибка дешифрования: {e}")
@@ -424,6 +654,9 @@ class SecureCryptoManager:
         finally:
             if 'file_key' in locals():
                 self._secure_erase(file_key)
+        
+        if hasher:
+            return hasher.hexdigest()
     
     def generate_key_from_password(self, password, salt=None):
         """Генерация ключа из пароля с защитой"""
@@ -450,16 +683,55 @@ class SecureCryptoManager:
     
     def calculate_file_hash(self, file_path, algorithm='sha256'):
         """Вычисление хэша файла"""
-        hash_func = getattr(hashlib, algorithm)()
+        try:
+            with open(file_path, 'rb', buffering=0) as f:
+                # Python 3.11+: цикл чтения и обновления хэша выполняется в C
+                if hasattr(hashlib, 'file_digest'):
+                    return hashlib.file_digest(f, algorithm).hexdigest()
+                
+                # Читаем файл по частям в один переиспользуемый буфер
+                return _update_hash_from_file(hashlib.new(algorithm), f).hexdigest()
+        except Exception as e:
+            logging.error(f"Ошибка вычисления хэша файла {file_path}: {e}")
+            return None
+    
+    def _get_file_mac_key(self) -> bytes:
+        """Ключ контроля целостности файлов (выводится из мастер-ключа один раз)"""
+        with self._key_lock:
+            if self._file_mac_key is None:
+                mac_key = HKDF(
+                    algorithm=hashes.SHA256(),
+                    length=_FILE_MAC_SIZE,
+                    salt=None,
+                    info=_FILE_MAC_KDF_INFO
+                ).derive(self._get_master_key())
+                self._file_mac_key = SecureKeyContainer(mac_key)
+            return self._file_mac_key.retrieve()
+    
+    def calculate_file_mac(self, file_path, algorithm=None):
+        """Ключевой хэш файла в виде 'алгоритм:hex' (BLAKE3, без пакета blake3 - BLAKE2b)
+        
+        None - алгоритм недоступен или файл не прочитан.
+        """
+        if algorithm is None:
+            algorithm = 'blake3' if blake3 is not None else 'blake2b'
+        if algorithm == 'blake3' and blake3 is None:
+            return None
         
         try:
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(8192), b""):
-                    hash_func.update(chunk)
+            key = self._get_file_mac_key()
+            if algorithm == 'blake3':
+                hash_func = blake3.blake3(key=key)
+            elif algorithm == 'blake2b':
+                hash_func = hashlib.blake2b(key=key, digest_size=_FILE_MAC_SIZE)
+            else:
+                raise ValueError(f"Неподдерживаемый алгоритм: {algorithm}")
             
-            return hash_func.hexdigest()
+            with open(file_path, 'rb', buffering=0) as f:
+                _update_hash_from_file(hash_func, f)
+            return f"{algorithm}:{hash_func.hexdigest()}"
         except Exception as e:
-            logging.error(f"Ошибка вычисления хэша файла {file_path}: {e}")
+            logging.error(f"Ошибка вычисления ключевого хэша файла {file_path}: {e}")
             return None
     
     def register_key(self, key_id, key_data):
@@ -1,4 +1,5 @@
 import os
+import hmac
 import bcrypt
 import base64
 import time
@@ -189,13 +190,8 @@ class SecureFolderSecurityManager:
     
     def _constant_time_compare(self, a, b):
         """Constant-time сравнение"""
-        if len(a) != len(b):
-            return False
-        
-        result = 0
-        for x, y in zip(a, b):
-            result |= x ^ y
-        return result == 0
+        # hmac.compare_digest выполняет то же сравнение на C, без цикла в Python
+        return hmac.compare_digest(a, b)
     
     def get_folder_key(self, folder_id):
         """Безопасное получение ключа папки"""
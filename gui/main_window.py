@@ -378,7 +378,10 @@ class BackupManager:
                 fs_dest = os.path.join('data', 'filesystem.json.enc')
                 
                 if os.path.exists(fs_source):
-                    shutil.copy2(fs_source, fs_dest)
+                    # Замена, а не запись поверх: текущий файл может быть жесткой ссылкой на бэкап
+                    fs_temp = fs_dest + '.restore'
+                    shutil.copy2(fs_source, fs_temp)
+                    os.replace(fs_temp, fs_dest)
                 else:
                     return False, "Файловая система не найдена в бэкапе"
                 
@@ -970,29 +973,7 @@ class SecureMediaVaultApp:
         self.content_tree.delete(*self.content_tree.get_children())
         
         try:
-            folder_data = self.vault_core.filesystem['folders'][self.current_folder_id]
-            subfolders = []
-            files = []
-            
-            for child_id in folder_data['children']:
-                if child_id in self.vault_core.filesystem['folders']:
-                    folder = self.vault_core.filesystem['folders'][child_id]
-                    folder_name = base64.b64decode(folder['encrypted_name']).decode()
-                    subfolders.append({
-                        'id': child_id,
-                        'name': folder_name,
-                        'is_locked': folder.get('is_locked', True),
-                        'created_at': folder.get('created_at', '')
-                    })
-                elif child_id in self.vault_core.filesystem['files']:
-                    file = self.vault_core.filesystem['files'][child_id]
-                    files.append({
-                        'id': child_id,
-                        'name': file['original_name'],
-                        'file_type': file['file_type'],
-                        'size': file['size'],
-                        'added_at': file['added_at']
-                    })
+            subfolders, files = self.vault_core.get_folder_contents(self.current_folder_id)
             
             for folder in subfolders:
                 display_name = f"🔒 {folder['name']}" if folder['is_locked'] else f"📁 {folder['name']}"
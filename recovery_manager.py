@@ -5,6 +5,28 @@ import bcrypt
 import base64
 import logging
 
+# Шрифты диалогов создаются один раз на сессию: CTkFont требует
+# инициализированного Tk, поэтому создание отложено до первого вызова
+_HEADER_FONT = None
+_HINT_FONT = None
+
+
+def _get_header_font():
+    """Шрифт заголовков диалогов восстановления"""
+    global _HEADER_FONT
+    if _HEADER_FONT is None:
+        _HEADER_FONT = ctk.CTkFont(size=16, weight="bold")
+    return _HEADER_FONT
+
+
+def _get_hint_font():
+    """Шрифт подсказок к паролю"""
+    global _HINT_FONT
+    if _HINT_FONT is None:
+        _HINT_FONT = ctk.CTkFont(weight="bold")
+    return _HINT_FONT
+
+
 class RecoveryManager:
     """Менеджер восстановления доступа к паролям"""
     
@@ -42,8 +64,9 @@ class RecoveryManager:
             folder_data, recovery_password
         )
         
-        # Обновляем данные папки
+        # Обновляем данные папки (она отображается в содержимом родительской)
         self.vault_core.filesystem['folders'][folder_id] = updated_data
+        self.vault_core._invalidate_folder_cache(folder_data.get('parent'))
         self.vault_core._save_filesystem()
         
         return True
@@ -70,13 +93,16 @@ class RecoveryManager:
 class MasterPasswordRecoveryDialog(ctk.CTkToplevel):
     """Диалог восстановления мастер-пароля"""
     
+    # Фиксированный размер окна (resizable=False)
+    WIDTH = 500
+    HEIGHT = 400
+    
     def __init__(self, parent, auth_manager):
         super().__init__(parent)
         self.auth_manager = auth_manager
         self.master_key = None  # Возвращаем мастер-ключ
         
         self.title("Восстановление мастер-пароля")
-        self.geometry("500x400")
         self.resizable(False, False)
         self.transient(parent)
         self.grab_set()
@@ -90,17 +116,18 @@ class MasterPasswordRecoveryDialog(ctk.CTkToplevel):
         main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
         
         ctk.CTkLabel(main_frame, text="Восстановление мастер-пароля", 
-                    font=ctk.CTkFont(size=16, weight="bold")).pack(pady=10)
+                    font=_get_header_font()).pack(pady=10)
         
         # Показываем подсказку
         hint = self.auth_manager.get_password_hint()
         if hint:
             ctk.CTkLabel(main_frame, text=f"Подсказка: {hint}", 
-                         font=ctk.CTkFont(weight="bold")).pack(pady=5)
+                         font=_get_hint_font()).pack(pady=5)
         
         # Поля для ответов на вопросы
         self.answer_entries = []
         questions = self.auth_manager.get_recovery_questions()
+        self._questions = questions
         
         if not questions:
             ctk.CTkLabel(main_frame, text="Вопросы восстановления не настроены", 
@@ -141,7 +168,8 @@ class MasterPasswordRecoveryDialog(ctk.CTkToplevel):
             answers.append(answer)
         
         try:
-            if not self.auth_manager.verify_recovery_answers(list(zip([q[0] for q in self.auth_manager.get_recovery_questions()], answers))):
+            # Вопросы уже получены при построении диалога; пары передаем лениво
+            if not self.auth_manager.verify_recovery_answers(zip((q for q, _ in self._questions), answers)):
                 self._show_error("Неверные ответы на вопросы восстановления")
                 return
             
@@ -164,17 +192,20 @@ class MasterPasswordRecoveryDialog(ctk.CTkToplevel):
     
     def center_window(self):
         """Центрирование окна"""
-        self.update_idletasks()
-        width = self.winfo_width()
-        height = self.winfo_height()
-        x = (self.winfo_screenwidth() // 2) - (width // 2)
-        y = (self.winfo_screenheight() // 2) - (height // 2)
-        self.geometry(f'{width}x{height}+{x}+{y}')
+        # Размер известен заранее, поэтому лишний проход раскладки не нужен:
+        # размер и позиция задаются одним вызовом geometry
+        x = (self.winfo_screenwidth() - self.WIDTH) // 2
+        y = (self.winfo_screenheight() - self.HEIGHT) // 2
+        self.geometry(f'{self.WIDTH}x{self.HEIGHT}+{x}+{y}')
 
 
 class PasswordChangeDialog(ctk.CTkToplevel):
     """Диалог смены пароля после восстановления"""
     
+    # Фиксированный размер окна (resizable=False)
+    WIDTH = 450
+    HEIGHT = 300
+    
     def __init__(self, parent, auth_manager, master_key):
         super().__init__(parent)
         self.auth_manager = auth_manager
@@ -182,7 +213,6 @@ class PasswordChangeDialog(ctk.CTkToplevel):
         self.result = None
         
         self.title("Установка нового пароля")
-        self.geometry("450x300")
         self.resizable(False, False)
         self.transient(parent)
         self.grab_set()
@@ -196,7 +226,7 @@ class PasswordChangeDialog(ctk.CTkToplevel):
         main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
         
         ctk.CTkLabel(main_frame, text="Установите новый мастер-пароль", 
-                    font=ctk.CTkFont(size=16, weight="bold")).pack(pady=10)
+                    font=_get_header_font()).pack(pady=10)
         
         ctk.CTkLabel(main_frame, text="Новый пароль:").pack(pady=5)
         self.new_password_entry = ctk.CTkEntry(main_frame, show="•", width=300)
@@ -264,17 +294,20 @@ class PasswordChangeDialog(ctk.CTkToplevel):
     
     def center_window(self):
         """Центрирование окна"""
-        self.update_idletasks()
-        width = self.winfo_width()
-        height = self.winfo_height()
-        x = (self.winfo_screenwidth() // 2) - (width // 2)
-        y = (self.winfo_screenheight() // 2) - (height // 2)
-        self.geometry(f'{width}x{height}+{x}+{y}')
+        # Размер известен заранее, поэтому лишний проход раскладки не нужен:
+        # размер и позиция задаются одним вызовом geometry
+        x = (self.winfo_screenwidth() - self.WIDTH) // 2
+        y = (self.winfo_screenheight() - self.HEIGHT) // 2
+        self.geometry(f'{self.WIDTH}x{self.HEIGHT}+{x}+{y}')
 
 
 class FolderRecoveryDialog(ctk.CTkToplevel):
     """Диалог восстановления доступа к папке"""
     
+    # Фиксированный размер окна (resizable=False)
+    WIDTH = 450
+    HEIGHT = 300
+    
     def __init__(self, parent, recovery_manager, folder_data):
         super().__init__(parent)
         self.recovery_manager = recovery_manager
@@ -282,7 +315,6 @@ class FolderRecoveryDialog(ctk.CTkToplevel):
         self.result = None
         
         self.title(f"Восстановление доступа к папке")
-        self.geometry("450x300")
         self.resizable(False, False)
         self.transient(parent)
         self.grab_set()
@@ -296,7 +328,7 @@ class FolderRecoveryDialog(ctk.CTkToplevel):
         main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
         
         ctk.CTkLabel(main_frame, text="Восстановление доступа к папке", 
-                    font=ctk.CTkFont(size=16, weight="bold")).pack(pady=10)
+                    font=_get_header_font()).pack(pady=10)
         
         folder_name = self.folder_data['name']
         ctk.CTkLabel(main_frame, text=f"Папка: {folder_name}").pack(pady=5)
@@ -344,9 +376,8 @@ class FolderRecoveryDialog(ctk.CTkToplevel):
     
     def center_window(self):
         """Центрирование окна"""
-        self.update_idletasks()
-        width = self.winfo_width()
-        height = self.winfo_height()
-        x = (self.winfo_screenwidth() // 2) - (width // 2)
-        y = (self.winfo_screenheight() // 2) - (height // 2)
-        self.geometry(f'{width}x{height}+{x}+{y}')
\ No newline at end of file
+        # Размер известен заранее, поэтому лишний проход раскладки не нужен:
+        # размер и позиция задаются одним вызовом geometry
+        x = (self.winfo_screenwidth() - self.WIDTH) // 2
+        y = (self.winfo_screenheight() - self.HEIGHT) // 2
+        self.geometry(f'{self.WIDTH}x{self.HEIGHT}+{x}+{y}')
\ No newline at end of file
@@ -1,6 +1,7 @@
 # securestring.py
 import os
 import sys
+import mmap
 import ctypes
 import secrets
 import threading
@@ -12,7 +13,8 @@ class SecureString:
     """
     
     def __init__(self, data: Union[str, bytes, bytearray]):
-        self._lock = threading.RLock()
+        # Методы не вызывают друг друга под блокировкой, реентерабельность не нужна
+        self._lock = threading.Lock()
         self._length = 0
         self._data_buffer = None
         
@@ -21,14 +23,19 @@ class SecureString:
         
         try:
             if isinstance(data, str):
-                encoded_data = data.encode('utf-8')
-                self._length = len(encoded_data)
-                self._data_buffer = ctypes.create_string_buffer(encoded_data)
-            elif isinstance(data, (bytes, bytearray)):
-                self._length = len(data)
-                self._data_buffer = ctypes.create_string_buffer(bytes(data))
+                source = data.encode('utf-8')
+            elif isinstance(data, bytes):
+                source = data
+            elif isinstance(data, bytearray):
+                # Представление над исходным буфером без промежуточной копии
+                source = (ctypes.c_char * len(data)).from_buffer(data)
             else:
                 raise TypeError("Data must be str, bytes or bytearray")
+            
+            # Единственное копирование: сразу в ctypes-буфер
+            self._length = len(source)
+            self._data_buffer = ctypes.create_string_buffer(self._length)
+            ctypes.memmove(self._data_buffer, source, self._length)
         except Exception as e:
             # В случае ошибки немедленно затираем любые частичные данные
             self.secure_clear()
@@ -50,6 +57,10 @@ class SecureString:
     
     def secure_clear(self):
         """Безопасное затирание данных из памяти"""
+        # Быстрый путь: данные уже затерты, блокировку не берем
+        if self._data_buffer is None:
+            return
+        
         with self._lock:
             if self._data_buffer is not None:
                 # Многократная перезапись случайными данными
@@ -71,6 +82,9 @@ class SecureString:
     
     def __del__(self):
         """Автоматическое затирание при уничтожении объекта"""
+        # Уже очищенные объекты не требуют работы при сборке мусора
+        if getattr(self, '_data_buffer', None) is None:
+            return
         self.secure_clear()
     
     def __len__(self):
@@ -93,6 +107,7 @@ class SecureTempFile:
     
     def __init__(self, suffix='.tmp', prefix='secure_', directory=None):
         self.path = None
+        self._mmaps = []
         self._suffix = suffix
         self._prefix = prefix
         self._directory = directory
@@ -116,16 +131,17 @@ class SecureTempFile:
         # Закрываем дескриптор, файл будет переоткрываться по необходимости
         os.close(fd)
     
-    def write_secure(self, data):
-        """Безопасная запись данных с немедленной синхронизацией"""
+    def write_secure(self, data, sync=True):
+        """Безопасная запись данных с немедленной синхронизацией (sync=False - без fsync)"""
         if not self.path:
             raise ValueError("File has been securely deleted")
         
         try:
             with open(self.path, 'wb') as f:
                 f.write(data)
-                f.flush()
-                os.fsync(f.fileno())
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
         except Exception as e:
             self.secure_delete()
             raise e
@@ -141,8 +157,42 @@ class SecureTempFile:
         except Exception as e:
             raise e
     
+    def read_secure_mmap(self) -> mmap.mmap:
+        """Чтение через отображение в память без копии данных в куче Python
+        
+        Отображение закрывается вызывающим кодом (поддерживает with) или
+        автоматически при secure_delete. Пустой файл отобразить нельзя.
+        """
+        if not self.path:
+            raise ValueError("File has been securely deleted")
+        
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        # Исключаем страницы с секретом из дампов памяти, где это поддерживается
+        if hasattr(mmap, 'MADV_DONTDUMP'):
+            try:
+                mapped.madvise(mmap.MADV_DONTDUMP)
+            except OSError:
+                pass
+        
+        self._mmaps.append(mapped)
+        return mapped
+    
+    def _close_mmaps(self):
+        """Закрытие всех отображений файла"""
+        for mapped in self._mmaps:
+            try:
+                mapped.close()
+            except (ValueError, BufferError):
+                pass
+        self._mmaps.clear()
+    
     def secure_delete(self):
         """Безопасное удаление файла с перезаписью"""
+        # Отображения нужно снять до перезаписи (на Windows иначе файл занят)
+        self._close_mmaps()
+        
         if self.path and os.path.exists(self.path):
             try:
                 # Получаем размер файла
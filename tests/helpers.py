@@ -0,0 +1,42 @@
+# tests/helpers.py - ОБЩИЕ ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ТЕСТОВ
+import os
+import random
+import tempfile
+
+
+def tmp_root():
+    """Директория для временных файлов тестов: VAULT_TESTS_TMPDIR или tmpfs, если доступен"""
+    override = os.environ.get('VAULT_TESTS_TMPDIR')
+    if override:
+        return override
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+_saved_tempdir = None
+
+
+# Подключаются в тестовом модуле: from tests.helpers import setUpModule, tearDownModule
+def setUpModule():
+    """Временные файлы тестов модуля создаются в tmp_root()"""
+    global _saved_tempdir
+    _saved_tempdir = tempfile.tempdir
+    tempfile.tempdir = tmp_root() or _saved_tempdir
+
+
+def tearDownModule():
+    """Восстановление директории временных файлов по умолчанию"""
+    tempfile.tempdir = _saved_tempdir
+
+
+# Псевдослучайные тестовые данные (10 МБ) генерируются один раз при импорте модуля
+_PAYLOAD = random.Random(0).randbytes(10 * 1024 * 1024)
+
+
+def fixture_data(size, seed=0):
+    """Тестовые данные: срез общего буфера без копирования, смещение зависит от seed"""
+    if not 0 <= size <= len(_PAYLOAD):
+        raise ValueError(f"Размер тестовых данных вне диапазона 0..{len(_PAYLOAD)}: {size}")
+    offset = (seed * 4096) % (len(_PAYLOAD) - size + 1)
+    return memoryview(_PAYLOAD)[offset:offset + size]
@@ -3,13 +3,44 @@
 import unittest
 import sys
 import os
+import io
+import shutil
 import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 
 # Добавляем родительскую директорию в путь для импорта
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+# Параллельный запуск без pytest-xdist: набор тестов - unittest, а часть кода пишет
+# по относительным путям (data/backups в BackupCreator, data/encrypted_files в
+# CryptoManager). Модули в общей директории мешали бы друг другу, поэтому каждый
+# модуль выполняется в своем процессе со своей временной рабочей директорией
+# (os.chdir меняет директорию только процесса-исполнителя).
+def _run_module_isolated(module_name):
+    """Запуск тестового модуля в отдельном процессе и собственной рабочей директории"""
+    work_dir = tempfile.mkdtemp(prefix='vault_tests_')
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        suite = unittest.TestLoader().loadTestsFromName(module_name)
+        stream = io.StringIO()
+        result = unittest.TextTestRunner(stream=stream, verbosity=2).run(suite)
+        return {
+            'module': module_name,
+            'tests_run': result.testsRun,
+            'failures': [(str(test), traceback) for test, traceback in result.failures],
+            'errors': [(str(test), traceback) for test, traceback in result.errors],
+            'skipped': [(str(test), reason) for test, reason in result.skipped],
+            'output': stream.getvalue()
+        }
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
 class TestRunner:
     """Запуск всех тестов"""
     
@@ -26,11 +57,8 @@ class TestRunner:
         )
         self.logger = logging.getLogger('TestRunner')
     
-    def discover_tests(self):
-        """Поиск всех тестов"""
-        test_loader = unittest.TestLoader()
-        
-        # Находим все тестовые модули
+    def _find_test_modules(self):
+        """Поиск всех тестовых модулей"""
         test_modules = []
         test_dir = os.path.dirname(os.path.abspath(__file__))
         
@@ -40,16 +68,32 @@ class TestRunner:
                 test_modules.append(f'tests.{module_name}')
         
         self.logger.info(f"Найдено тестовых модулей: {len(test_modules)}")
+        return test_modules
+    
+    def discover_tests(self):
+        """Поиск всех тестов"""
+        test_loader = unittest.TestLoader()
         
-        # Загружаем тесты из каждого модуля
-        test_suites = []
-        for module_name in test_modules:
+        # Находим все тестовые модули
+        test_modules = self._find_test_modules()
+        
+        # Загружаем тесты из модулей параллельно: импорт тяжелых
+        # C-расширений (cryptography, bcrypt) перекрывается между потоками
+        def load_module(module_name):
             try:
-                suite = test_loader.loadTestsFromName(module_name)
-                test_suites.append(suite)
-                self.logger.info(f"  Загружен: {module_name}")
+                return module_name, test_loader.loadTestsFromName(module_name), None
             except Exception as e:
-                self.logger.error(f"  Ошибка загрузки {module_name}: {e}")
+                return module_name, None, e
+        
+        test_suites = []
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            # map сохраняет порядок модулей, поэтому порядок тестов стабилен
+            for module_name, suite, error in executor.map(load_module, test_modules):
+                if error is None:
+                    test_suites.append(suite)
+                    self.logger.info(f"  Загружен: {module_name}")
+                else:
+                    self.logger.error(f"  Ошибка загрузки {module_name}: {error}")
         
         return unittest.TestSuite(test_suites)
     
@@ -85,8 +129,48 @@ class TestRunner:
         
         return result.wasSuccessful()
     
+    def run_all_tests_parallel(self):
+        """Запуск всех тестов: каждый модуль в отдельном процессе"""
+        self.logger.info("=" * 60)
+        self.logger.info("ПАРАЛЛЕЛЬНЫЙ ЗАПУСК ТЕСТОВ MEDIA VAULT")
+        self.logger.info("=" * 60)
+        
+        test_modules = self._find_test_modules()
+        
+        # Результаты модулей собираются в один объект для общего отчета
+        result = unittest.TestResult()
+        with ProcessPoolExecutor(max_workers=min(len(test_modules), os.cpu_count() or 1)) as executor:
+            for module_result in executor.map(_run_module_isolated, test_modules):
+                self.logger.info(
+                    f"  Выполнен: {module_result['module']} "
+                    f"(тестов: {module_result['tests_run']}, "
+                    f"провалов: {len(module_result['failures'])}, "
+                    f"ошибок: {len(module_result['errors'])})"
+                )
+                # Подробный вывод unittest - на уровне DEBUG, трассировки попадают в отчет
+                self.logger.debug(module_result['output'])
+                
+                result.testsRun += module_result['tests_run']
+                result.failures.extend(module_result['failures'])
+                result.errors.extend(module_result['errors'])
+                result.skipped.extend(module_result['skipped'])
+        
+        self.total_tests = result.testsRun
+        self.failed_tests = len(result.failures) + len(result.errors)
+        self.passed_tests = self.total_tests - self.failed_tests
+        
+        self._save_detailed_results(result)
+        self._print_summary(result)
+        
+        return result.wasSuccessful()
+    
     def _save_detailed_results(self, result):
         """Сохранение детальных результатов"""
+        # Отчет нужен только при наличии проваленных, ошибочных или пропущенных тестов
+        if not result.failures and not result.errors and not result.skipped:
+            self.logger.info("Все тесты пройдены, детальный отчет не требуется")
+            return
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         report_file = f'test_report_{timestamp}.txt'
         
@@ -218,6 +302,8 @@ def main():
                        help='Запустить только тесты производительности')
     parser.add_argument('--coverage', action='store_true',
                        help='Сгенерировать отчет о покрытии')
+    parser.add_argument('--parallel', action='store_true',
+                       help='Запускать тестовые модули параллельно в отдельных процессах')
     
     args = parser.parse_args()
     
@@ -229,6 +315,8 @@ def main():
         elif args.coverage:
             runner.generate_coverage_report()
             success = True
+        elif args.parallel:
+            success = runner.run_all_tests_parallel()
         else:
             success = runner.run_all_tests()
         
@@ -5,15 +5,33 @@ import os
 import json
 import zipfile
 import shutil
-from unittest.mock import Mock, patch, MagicMock
+from pathlib import Path
+from unittest.mock import DEFAULT, Mock, patch, MagicMock
 
 from backup_manager import (
+    BackupInfo,
     BackupStrategy,
     BackupIntegrityChecker,
     BackupCreator,
     BackupRestorer,
     BackupManager
 )
+from auth import AuthManager
+from crypto import CryptoManager
+from vault_core import VaultCore
+from tests.helpers import setUpModule, tearDownModule
+
+# Фиксированное время для детерминированных тестов (2024-01-01 00:00:00 UTC)
+FIXED_EPOCH = 1704067200
+
+
+def _write_bytes(path, data):
+    """Запись файла через дескриптор, без объекта файла Python"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
 
 
 class TestBackupStrategy(unittest.TestCase):
@@ -21,7 +39,9 @@ class TestBackupStrategy(unittest.TestCase):
     
     def setUp(self):
         """Настройка перед каждым тестом"""
-        self.strategy = BackupStrategy(max_backups=5, retention_days=7)
+        self.strategy = BackupStrategy(
+            max_backups=5, retention_days=7, clock=lambda: FIXED_EPOCH
+        )
     
     def test_should_create_backup(self):
         """Тест определения необходимости бэкапа"""
@@ -31,7 +51,7 @@ class TestBackupStrategy(unittest.TestCase):
         self.assertTrue(self.strategy.should_create_backup(None))
         
         # Бэкап сегодня
-        now = datetime.now()
+        now = datetime.fromtimestamp(FIXED_EPOCH)
         self.assertFalse(self.strategy.should_create_backup(now))
         
         # Бэкап вчера
@@ -46,61 +66,63 @@ class TestBackupStrategy(unittest.TestCase):
         """Тест определения бэкапов для удаления"""
         from datetime import datetime, timedelta
         
-        now = datetime.now()
+        now = datetime.fromtimestamp(FIXED_EPOCH)
         
         # Создаем тестовые бэкапы
-        backups = []
-        for i in range(10):
-            backup_time = now - timedelta(days=i)
-            backups.append({
-                'path': f'/backup/backup_{i}.zip',
-                'created_at': backup_time
-            })
+        day = timedelta(days=1)
+        backups = [
+            {'path': f'/backup/backup_{i}.zip', 'created_at': now - i * day}
+            for i in range(10)
+        ]
         
         # Проверяем, какие бэкапы нужно удалить
         to_delete = self.strategy.get_backups_to_delete(backups)
         
-        # Должно быть удалено 5 бэкапов (10 - 5)
+        # Должно быть удалено 5 бэкапов (10 - 5): 8 и 9 дней - старше 7 дней, 5-7 - сверх лимита
         self.assertEqual(len(to_delete), 5)
         
         # Проверяем, что удаляются самые старые
-        expected_to_delete = [f'/backup/backup_{i}.zip' for i in range(5)]
+        expected_to_delete = [f'/backup/backup_{i}.zip' for i in range(5, 10)]
         self.assertEqual(sorted(to_delete), sorted(expected_to_delete))
     
     def test_get_backups_to_delete_with_old_backups(self):
         """Тест удаления старых бэкапов"""
         from datetime import datetime, timedelta
         
-        now = datetime.now()
+        now = datetime.fromtimestamp(FIXED_EPOCH)
         
         # Создаем бэкапы, некоторые очень старые
         backups = [
-            {'path': '/backup/old_30.zip', 'created_at': now - timedelta(days=30)},
-            {'path': '/backup/old_15.zip', 'created_at': now - timedelta(days=15)},
-            {'path': '/backup/new_1.zip', 'created_at': now - timedelta(days=1)},
-            {'path': '/backup/new_2.zip', 'created_at': now - timedelta(days=2)},
+            BackupInfo('/backup/old_30.zip', now - timedelta(days=30)),
+            BackupInfo('/backup/old_15.zip', now - timedelta(days=15)),
+            BackupInfo('/backup/new_1.zip', now - timedelta(days=1)),
+            BackupInfo('/backup/new_2.zip', now - timedelta(days=2)),
         ]
         
         to_delete = self.strategy.get_backups_to_delete(backups)
         
-        # Должны быть удалены бэкапы старше 7 дней
-        self.assertIn('/backup/old_30.zip', to_delete)
-        self.assertIn('/backup/old_15.zip', to_delete)
-        self.assertNotIn('/backup/new_1.zip', to_delete)
-        self.assertNotIn('/backup/new_2.zip', to_delete)
+        # Должны быть удалены бэкапы старше 7 дней, хотя лимит количества не превышен
+        self.assertEqual(sorted(to_delete), ['/backup/old_15.zip', '/backup/old_30.zip'])
 
 
 class TestBackupIntegrityChecker(unittest.TestCase):
     """Тесты проверки целостности"""
     
+    @classmethod
+    def setUpClass(cls):
+        """Общая временная директория для всех тестов класса"""
+        cls._root_dir = tempfile.TemporaryDirectory(prefix='integrity_test_')
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Удаление общей временной директории"""
+        cls._root_dir.cleanup()
+    
     def setUp(self):
         """Настройка перед каждым тестом"""
-        self.test_dir = tempfile.mkdtemp(prefix='integrity_test_')
-    
-    def tearDown(self):
-        """Очистка после каждого теста"""
-        if os.path.exists(self.test_dir):
-            shutil.rmtree(self.test_dir)
+        # Каждому тесту - своя поддиректория внутри общей
+        self.test_dir = os.path.join(self._root_dir.name, self._testMethodName)
+        os.mkdir(self.test_dir)
     
     def test_calculate_backup_hash(self):
         """Тест вычисления хэша"""
@@ -121,6 +143,26 @@ class TestBackupIntegrityChecker(unittest.TestCase):
         hash_value2 = BackupIntegrityChecker.calculate_backup_hash(test_file)
         self.assertEqual(hash_value, hash_value2)
     
+    def test_calculate_backup_hash_after_change(self):
+        """Тест пересчета хэша после изменения файла"""
+        test_file = os.path.join(self.test_dir, 'test.txt')
+        
+        with open(test_file, 'wb') as f:
+            f.write(b"Original content")
+        
+        original_hash = BackupIntegrityChecker.calculate_backup_hash(test_file)
+        original_stat = os.stat(test_file)
+        
+        # Порча того же размера с восстановленным временем изменения (как touch -r)
+        with open(test_file, 'r+b') as f:
+            f.write(b"X")
+        os.utime(test_file, ns=(original_stat.st_atime_ns, original_stat.st_mtime_ns))
+        
+        # Хэш считается заново по содержимому
+        self.assertNotEqual(
+            BackupIntegrityChecker.calculate_backup_hash(test_file), original_hash
+        )
+    
     def test_verify_backup_integrity(self):
         """Тест проверки целостности"""
         # Создаем тестовый файл
@@ -143,13 +185,39 @@ class TestBackupIntegrityChecker(unittest.TestCase):
         self.assertFalse(BackupIntegrityChecker.verify_backup_integrity(
             test_file, wrong_hash
         ))
+        
+        # Проверяем правильный хэш вместе с размером
+        self.assertTrue(BackupIntegrityChecker.verify_backup_integrity(
+            test_file, correct_hash, len(test_content)
+        ))
+    
+    def test_verify_backup_integrity_truncated(self):
+        """Тест обнаружения обрезанного бэкапа по размеру"""
+        test_file = os.path.join(self.test_dir, 'test.txt')
+        test_content = b"Test content"
+        
+        with open(test_file, 'wb') as f:
+            f.write(test_content)
+        
+        correct_hash = BackupIntegrityChecker.calculate_backup_hash(test_file)
+        
+        # Обрезаем файл
+        with open(test_file, 'r+b') as f:
+            f.truncate(len(test_content) // 2)
+        
+        # Хэш не должен вычисляться: размер не совпадает
+        with patch.object(BackupIntegrityChecker, 'calculate_backup_hash') as mock_hash:
+            self.assertFalse(BackupIntegrityChecker.verify_backup_integrity(
+                test_file, correct_hash, len(test_content)
+            ))
+            mock_hash.assert_not_called()
     
     def test_check_backup_structure(self):
         """Тест проверки структуры архива"""
         # Создаем правильный ZIP архив
         good_zip = os.path.join(self.test_dir, 'good_backup.zip')
         
-        with zipfile.ZipFile(good_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with zipfile.ZipFile(good_zip, 'w', zipfile.ZIP_STORED) as zipf:
             zipf.writestr('manifest.json', '{"version": "1.0"}')
             zipf.writestr('filesystem.json.enc', 'encrypted_data')
             zipf.writestr('vault_config.json', 'config_data')
@@ -161,13 +229,18 @@ class TestBackupIntegrityChecker(unittest.TestCase):
         # Создаем архив без обязательных файлов
         bad_zip = os.path.join(self.test_dir, 'bad_backup.zip')
         
-        with zipfile.ZipFile(bad_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with zipfile.ZipFile(bad_zip, 'w', zipfile.ZIP_STORED) as zipf:
             zipf.writestr('some_file.txt', 'data')
         
         # Проверяем архив без обязательных файлов
         issues = BackupIntegrityChecker.check_backup_structure(bad_zip)
         self.assertGreater(len(issues), 0)
         
+        # Отсутствуют все обязательные файлы
+        missing = BackupIntegrityChecker.REQUIRED_MEMBERS - {'some_file.txt'}
+        self.assertEqual(missing, {'manifest.json', 'filesystem.json.enc', 'vault_config.json'})
+        self.assertEqual(len(issues), len(missing))
+        
         # Создаем поврежденный архив
         corrupted_zip = os.path.join(self.test_dir, 'corrupted.zip')
         
@@ -177,6 +250,31 @@ class TestBackupIntegrityChecker(unittest.TestCase):
         # Проверяем поврежденный архив
         issues = BackupIntegrityChecker.check_backup_structure(corrupted_zip)
         self.assertGreater(len(issues), 0)
+        
+        # Быстрая проверка по CRC-32
+        self.assertEqual(BackupIntegrityChecker.quick_verify(good_zip), [])
+        self.assertGreater(len(BackupIntegrityChecker.quick_verify(corrupted_zip)), 0)
+    
+    def test_quick_verify_detects_bit_flip(self):
+        """Тест обнаружения поврежденной записи по CRC-32"""
+        backup_zip = os.path.join(self.test_dir, 'backup.zip')
+        payload = b'encrypted_data' * 10
+        
+        with zipfile.ZipFile(backup_zip, 'w', zipfile.ZIP_STORED) as zipf:
+            zipf.writestr('filesystem.json.enc', payload)
+        
+        self.assertEqual(BackupIntegrityChecker.quick_verify(backup_zip), [])
+        
+        # Инвертируем один бит в данных записи
+        with open(backup_zip, 'r+b') as f:
+            data = f.read()
+            offset = data.index(payload) + len(payload) // 2
+            f.seek(offset)
+            f.write(bytes([data[offset] ^ 0x01]))
+        
+        issues = BackupIntegrityChecker.quick_verify(backup_zip)
+        self.assertEqual(len(issues), 1)
+        self.assertIn('filesystem.json.enc', issues[0])
 
 
 class TestBackupCreator(unittest.TestCase):
@@ -187,13 +285,13 @@ class TestBackupCreator(unittest.TestCase):
         self.test_dir = tempfile.mkdtemp(prefix='backup_test_')
         
         # Мокируем менеджеры
-        self.crypto_mock = Mock()
-        self.auth_mock = Mock()
-        self.vault_core_mock = Mock()
+        self.crypto_mock = Mock(spec=CryptoManager)
+        self.auth_mock = Mock(spec=AuthManager)
+        self.vault_core_mock = Mock(spec=VaultCore)
         
         # Настраиваем моки
         self.crypto_mock.generate_key_from_password.return_value = (
-            b'encryption_key_32_bytes_long!!', 
+            b'encryption_key_32_bytes_long!!',
             b'salt_32_bytes'
         )
         
@@ -218,8 +316,7 @@ class TestBackupCreator(unittest.TestCase):
         os.makedirs(os.path.join(self.test_dir, 'encrypted_files'), exist_ok=True)
         for i in range(3):
             file_path = os.path.join(self.test_dir, 'encrypted_files', f'file{i}.myarc')
-            with open(file_path, 'wb') as f:
-                f.write(f'encrypted_data_{i}'.encode())
+            _write_bytes(file_path, b'encrypted_data_%d' % i)
     
     def tearDown(self):
         """Очистка после каждого теста"""
@@ -288,55 +385,55 @@ class TestBackupCreator(unittest.TestCase):
         
         self.assertTrue(success)
         
-        # Проверяем целостность
+        # Читаем манифест за одно открытие архива
         with zipfile.ZipFile(backup_path, 'r') as zipf:
-            # Читаем манифест
-            with zipf.open('manifest.json') as f:
-                manifest = json.load(f)
-            
-            # Проверяем хэш
-            expected_hash = manifest.get('hash')
-            self.assertIsNotNone(expected_hash)
-            
-            # Проверяем целостность
-            is_valid = BackupIntegrityChecker.verify_backup_integrity(
-                backup_path, expected_hash
-            )
-            self.assertTrue(is_valid)
+            manifest = json.loads(zipf.read('manifest.json'))
+        
+        # Проверяем хэш
+        expected_hash = manifest.get('hash')
+        self.assertIsNotNone(expected_hash)
+        
+        # Проверяем целостность (архив уже закрыт, хэш считается по файлу)
+        is_valid = BackupIntegrityChecker.verify_backup_integrity(
+            backup_path, expected_hash
+        )
+        self.assertTrue(is_valid)
 
 
 class TestBackupRestorer(unittest.TestCase):
     """Тесты восстановления из бэкапов"""
     
+    @classmethod
+    def setUpClass(cls):
+        """Тестовый бэкап создается один раз: тесты восстановления его не изменяют"""
+        cls._shared_dir = tempfile.mkdtemp(prefix='restore_test_')
+        cls.backup_path = cls._create_test_backup(cls._shared_dir)
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Удаление общего тестового бэкапа"""
+        shutil.rmtree(cls._shared_dir, ignore_errors=True)
+    
     def setUp(self):
         """Настройка перед каждым тестом"""
-        self.test_dir = tempfile.mkdtemp(prefix='restore_test_')
-        
         # Мокируем менеджеры
-        self.crypto_mock = Mock()
-        self.auth_mock = Mock()
+        self.crypto_mock = Mock(spec=CryptoManager)
+        self.auth_mock = Mock(spec=AuthManager)
         
         # Настраиваем моки
         self.crypto_mock.generate_key_from_password.return_value = (
-            b'encryption_key_32_bytes_long!!', 
+            b'encryption_key_32_bytes_long!!',
             b'salt_32_bytes'
         )
         
         # Создаем экземпляр BackupRestorer
         self.restorer = BackupRestorer(self.crypto_mock, self.auth_mock)
-        
-        # Создаем тестовый бэкап
-        self.create_test_backup()
     
-    def tearDown(self):
-        """Очистка после каждого теста"""
-        if os.path.exists(self.test_dir):
-            shutil.rmtree(self.test_dir)
-    
-    def create_test_backup(self):
+    @staticmethod
+    def _create_test_backup(test_dir):
         """Создание тестового бэкапа"""
         # Создаем ZIP архив с тестовыми данными
-        self.backup_path = os.path.join(self.test_dir, 'test_backup.zip')
+        backup_path = os.path.join(test_dir, 'test_backup.zip')
         
         # Манифест
         manifest = {
@@ -352,79 +449,70 @@ class TestBackupRestorer(unittest.TestCase):
             }
         }
         
-        with zipfile.ZipFile(self.backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # Содержимое архива без манифеста
+        entries = [
+            ('filesystem.json.enc', b'encrypted_filesystem_data'),
+            ('vault_config.json', b'config_data'),
+            ('encrypted_files/file1.mya', b'encrypted_file_data_1'),
+            ('encrypted_files/file2.mya', b'encrypted_file_data_2'),
+        ]
+        
+        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_STORED) as zipf:
             # Добавляем манифест
-            manifest_str = json.dumps(manifest, indent=2)
+            manifest_str = json.dumps(manifest, separators=(',', ':'))
             zipf.writestr('manifest.json', manifest_str)
             
-            # Добавляем тестовые файлы
-            zipf.writestr('filesystem.json.enc', 'encrypted_filesystem_data')
-            zipf.writestr('vault_config.json', 'config_data')
-            
-            # Добавляем зашифрованные файлы
-            zipf.writestr('encrypted_files/file1.mya', 'encrypted_file_data_1')
-            zipf.writestr('encrypted_files/file2.mya', 'encrypted_file_data_2')
-        
-        # Вычисляем и добавляем хэш
-        hash_value = BackupIntegrityChecker.calculate_backup_hash(self.backup_path)
-        manifest['hash'] = hash_value
-        
-        # Обновляем манифест в архиве
-        with zipfile.ZipFile(self.backup_path, 'a', zipfile.ZIP_DEFLATED) as zipf:
-            # Удаляем старый манифест
-            zipf.remove('manifest.json')
-            
-            # Добавляем новый с хэшем
-            manifest_str = json.dumps(manifest, indent=2)
-            zipf.writestr('manifest.json', manifest_str)
+            # Добавляем данные бэкапа
+            for name, data in entries:
+                zipf.writestr(name, data)
+        
+        # Хэш архива с манифестом без хэша - как его вычисляет BackupCreator. Хранится
+        # в комментарии ZIP: дозапись меняет только центральный каталог, архив не перестраивается
+        backup_hash = BackupIntegrityChecker.calculate_backup_hash(backup_path)
+        with zipfile.ZipFile(backup_path, 'a') as zipf:
+            zipf.comment = backup_hash.encode()
+        
+        return backup_path
     
-    def test_restore_full_backup(self):
+    @patch('os.path.exists', return_value=True)
+    @patch('os.makedirs')
+    @patch.multiple('shutil', copy2=DEFAULT, rmtree=DEFAULT)
+    def test_restore_full_backup(self, mock_makedirs, mock_exists, copy2, rmtree):
         """Тест полного восстановления"""
-        # Мокируем директории
-        with patch('shutil.copy2') as mock_copy, \
-             patch('shutil.rmtree') as mock_rmtree, \
-             patch('os.makedirs') as mock_makedirs, \
-             patch('os.path.exists', return_value=True):
-            
-            # Восстанавливаем
-            success, message = self.restorer.restore_backup(
-                self.backup_path, None, 'full'
-            )
-            
-            # Проверяем успешность
-            self.assertTrue(success)
-            self.assertIn("успешно", message.lower())
-            
-            # Проверяем, что функции были вызваны
-            self.assertGreater(mock_copy.call_count, 0)
+        # Восстанавливаем
+        success, message = self.restorer.restore_backup(
+            self.backup_path, None, 'full'
+        )
+        
+        # Проверяем успешность
+        self.assertTrue(success)
+        self.assertIn("успешно", message.lower())
+        
+        # Проверяем, что функции были вызваны
+        self.assertGreater(copy2.call_count, 0)
     
-    def test_restore_encrypted_backup(self):
+    @patch('os.path.exists', return_value=True)
+    @patch('os.makedirs')
+    @patch.multiple('shutil', copy2=DEFAULT, rmtree=DEFAULT)
+    @patch('backup_manager.Fernet')
+    def test_restore_encrypted_backup(self, mock_fernet_class, mock_makedirs, mock_exists, **_):
         """Тест восстановления из зашифрованного бэкапа"""
-        # Мокируем расшифровку
-        with open(self.backup_path, 'rb') as f:
-            backup_data = f.read()
-        
         self.crypto_mock.generate_key_from_password.return_value = (
             b'key_32_bytes', b'salt_32_bytes'
         )
         
-        # Мокируем Fernet
-        with patch('backup_manager.Fernet') as mock_fernet_class:
-            mock_fernet = Mock()
-            mock_fernet.decrypt.return_value = backup_data
-            mock_fernet_class.return_value = mock_fernet
-            
-            # Мокируем остальные операции
-            with patch('shutil.copy2'), patch('shutil.rmtree'), \
-                 patch('os.makedirs'), patch('os.path.exists', return_value=True):
-                
-                # Восстанавливаем с паролем
-                success, message = self.restorer.restore_backup(
-                    self.backup_path, 'password', 'full'
-                )
-                
-                # Проверяем успешность
-                self.assertTrue(success)
+        # Мокируем расшифровку: архив читается только при реальном вызове decrypt
+        mock_fernet_class.return_value.decrypt.side_effect = (
+            lambda _: Path(self.backup_path).read_bytes()
+        )
+        
+        # Восстанавливаем с паролем
+        success, message = self.restorer.restore_backup(
+            self.backup_path, 'password', 'full'
+        )
+        
+        # Проверяем успешность
+        self.assertTrue(success)
     
     def test_restore_filesystem_only(self):
         """Тест восстановления только файловой системы"""
@@ -464,9 +552,9 @@ class TestBackupManagerIntegration(unittest.TestCase):
         self.test_dir = tempfile.mkdtemp(prefix='backup_manager_test_')
         
         # Мокируем зависимости
-        self.crypto_mock = Mock()
-        self.auth_mock = Mock()
-        self.vault_core_mock = Mock()
+        self.crypto_mock = Mock(spec=CryptoManager)
+        self.auth_mock = Mock(spec=AuthManager)
+        self.vault_core_mock = Mock(spec=VaultCore)
         
         # Создаем менеджер бэкапов
         self.manager = BackupManager(
@@ -512,7 +600,7 @@ class TestBackupManagerIntegration(unittest.TestCase):
         # Создаем тестовый бэкап
         backup_path = os.path.join(self.test_dir, 'test_backup.zip')
         
-        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_STORED) as zipf:
             zipf.writestr('manifest.json', '{"version": "1.0"}')
             zipf.writestr('filesystem.json.enc', 'data')
             zipf.writestr('vault_config.json', 'data')
@@ -550,4 +638,4 @@ class TestBackupManagerIntegration(unittest.TestCase):
 
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
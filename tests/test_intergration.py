@@ -2,6 +2,8 @@
 import unittest
 import tempfile
 import os
+import hashlib
+import mmap
 import shutil
 import threading
 import time
@@ -12,38 +14,48 @@ from crypto import CryptoManager
 from vault_core import VaultCore
 from folder_security import FolderSecurityManager
 from backup_manager import BackupManager
+from tests.helpers import fixture_data
 
 
 class IntegrationTest(unittest.TestCase):
     """Интеграционные тесты всей системы"""
     
+    @classmethod
+    def setUpClass(cls):
+        """Мастер-пароль создается один раз: вывод ключа намеренно медленный"""
+        config_dir = tempfile.mkdtemp(prefix='integration_config_')
+        cls.addClassCleanup(shutil.rmtree, config_dir, ignore_errors=True)
+        
+        # Тесты только читают конфигурацию, поэтому менеджер аутентификации общий
+        cls.test_password = "TestPassword123!"
+        cls.auth = AuthManager(os.path.join(config_dir, 'vault_config.json'))
+        cls.master_key = cls.auth.create_master_password(
+            cls.test_password,
+            "Test hint"
+        )
+    
     def setUp(self):
         """Настройка перед каждым тестом"""
         # Создаем временную директорию для тестов
         self.test_dir = tempfile.mkdtemp(prefix='integration_test_')
+        self.addCleanup(shutil.rmtree, self.test_dir, ignore_errors=True)
         
-        # Инициализируем менеджеры
-        self.auth = AuthManager()
-        self.auth.config_path = os.path.join(self.test_dir, 'vault_config.json')
-        
-        # Создаем мастер-пароль
-        self.test_password = "TestPassword123!"
-        self.master_key = self.auth.create_master_password(
-            self.test_password,
-            "Test hint"
-        )
-        
-        # Инициализируем остальные компоненты
+        # Ключ уже выведен, создание криптоменеджера не требует KDF
         self.crypto = CryptoManager(self.master_key)
+        self.addCleanup(self.crypto.secure_clear)
+        
         self.folder_security = FolderSecurityManager(self.crypto)
+        self.addCleanup(self.folder_security.cleanup)
+        
+        # Используем тестовые пути
         self.vault = VaultCore(
             self.auth,
             self.crypto,
-            self.folder_security
+            self.folder_security,
+            filesystem_path=os.path.join(self.test_dir, 'filesystem.json.enc'),
+            backup_dir=os.path.join(self.test_dir, 'backups')
         )
-        
-        # Используем тестовые пути
-        self.vault.filesystem_path = os.path.join(self.test_dir, 'filesystem.json.enc')
+        self.addCleanup(self.vault.cleanup)
         
         # Создаем менеджер бэкапов
         self.backup_manager = BackupManager(
@@ -53,22 +65,6 @@ class IntegrationTest(unittest.TestCase):
         )
         self.backup_manager.creator.backup_dir = os.path.join(self.test_dir, 'backups')
     
-    def tearDown(self):
-        """Очистка после каждого теста"""
-        # Очищаем ресурсы
-        if hasattr(self, 'crypto'):
-            self.crypto.secure_clear()
-        
-        if hasattr(self, 'folder_security'):
-            self.folder_security.cleanup()
-        
-        if hasattr(self, 'vault'):
-            self.vault.cleanup()
-        
-        # Удаляем тестовую директорию
-        if os.path.exists(self.test_dir):
-            shutil.rmtree(self.test_dir)
-    
     def test_complete_workflow(self):
         """Тест полного рабочего процесса"""
         # 1. Создаем тестовые файлы
@@ -138,8 +134,7 @@ class IntegrationTest(unittest.TestCase):
         
         # Запускаем конкурентное добавление
         with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [executor.submit(add_file, file_path) for file_path in test_files]
-            results = [future.result() for future in concurrent.futures.as_completed(futures)]
+            results = list(executor.map(add_file, test_files))
         
         # Проверяем, что все файлы добавлены
         successful_adds = [r for r in results if isinstance(r, str) and r.startswith('file_')]
@@ -253,7 +248,7 @@ class IntegrationTest(unittest.TestCase):
         
         # Создаем большой файл (10 MB)
         large_file = os.path.join(self.test_dir, 'large.bin')
-        large_data = os.urandom(10 * 1024 * 1024)  # 10 MB
+        large_data = fixture_data(10 * 1024 * 1024)  # 10 MB
         
         with open(large_file, 'wb') as f:
             f.write(large_data)
@@ -274,11 +269,13 @@ class IntegrationTest(unittest.TestCase):
         output_file = os.path.join(self.test_dir, 'decrypted.bin')
         self.crypto.decrypt_large_file(vault_filename, output_file)
         
-        # Проверяем содержимое
+        # Проверяем содержимое по хэшу, не загружая расшифрованный файл в память
         with open(output_file, 'rb') as f:
-            decrypted_data = f.read()
-        
-        self.assertEqual(decrypted_data, large_data)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as decrypted_data:
+                self.assertEqual(
+                    hashlib.sha256(decrypted_data).digest(),
+                    hashlib.sha256(large_data).digest()
+                )
         
         # Очистка
         self.crypto.secure_clear()
@@ -1,14 +1,36 @@
 # tests/test_security.py - ТЕСТЫ БЕЗОПАСНОСТИ
 import unittest
+import filecmp
 import tempfile
 import os
 import json
 import base64
+import hashlib
+import shutil
+import platform
+import time
 from unittest.mock import Mock, patch
 
+from cryptography.fernet import Fernet
+from cryptography.hazmat.backends.openssl import backend as openssl_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
 from auth import AuthManager
-from crypto import CryptoManager
-from securestring import SecureString
+from crypto import CryptoManager, has_hardware_aes
+from securestring import SecureString, SecureTempFile
+from tests.helpers import fixture_data, setUpModule, tearDownModule
+
+# Профили стоимости KDF для AuthManager: fast - тесты проверяют логику, а не стойкость
+# вывода ключа; production - параметры по умолчанию. Выбирается через AUTH_TEST_KDF_PROFILE
+_KDF_PROFILES = {
+    'fast': {'kdf_iterations': 1000},
+    'production': {},
+}
+_TEST_KDF_PROFILE = _KDF_PROFILES[os.environ.get('AUTH_TEST_KDF_PROFILE', 'fast')]
+# Минимальная стоимость bcrypt для ответов восстановления в тестах логики
+_TEST_BCRYPT_ROUNDS = 4
 
 
 class TestSecureString(unittest.TestCase):
@@ -47,6 +69,24 @@ class TestSecureString(unittest.TestCase):
         self.assertEqual(retrieved, test_data)
 
 
+class TestSecureTempFile(unittest.TestCase):
+    """Тесты безопасных временных файлов"""
+    
+    def test_read_secure_mmap(self):
+        """Тест чтения через отображение в память"""
+        test_data = b"secret file contents"
+        
+        with SecureTempFile() as temp_file:
+            temp_file.write_secure(test_data)
+            
+            mapped = temp_file.read_secure_mmap()
+            self.assertEqual(mapped[:], test_data)
+            
+            # Отображение закрывается вместе с удалением файла
+            temp_file.secure_delete()
+            self.assertTrue(mapped.closed)
+
+
 class TestCryptoManager(unittest.TestCase):
     """Тесты менеджера шифрования"""
     
@@ -93,6 +133,14 @@ class TestCryptoManager(unittest.TestCase):
         with self.assertRaises(Exception):
             self.crypto.encrypt_data(self.test_data)
     
+    def test_secure_erase_overwrites_buffer(self):
+        """Тест затирания изменяемого буфера на месте"""
+        buffer = bytearray(self.test_data)
+        self.crypto._secure_erase(buffer)
+        
+        self.assertEqual(len(buffer), len(self.test_data))
+        self.assertNotEqual(bytes(buffer), self.test_data)
+    
     def test_file_encryption(self):
         """Тест шифрования файла"""
         with tempfile.NamedTemporaryFile(mode='wb', delete=False) as f:
@@ -111,10 +159,7 @@ class TestCryptoManager(unittest.TestCase):
             self.crypto.decrypt_file(vault_filename, output_file)
             
             # Проверяем содержимое
-            with open(output_file, 'rb') as f:
-                decrypted_data = f.read()
-            
-            self.assertEqual(decrypted_data, self.test_data)
+            self.assertTrue(filecmp.cmp(output_file, temp_file, shallow=False))
             
             # Очистка
             os.unlink(vault_filename)
@@ -126,10 +171,10 @@ class TestCryptoManager(unittest.TestCase):
     def test_large_file_encryption(self):
         """Тест шифрования большого файла"""
         # Создаем большой файл (5 MB)
-        large_data = os.urandom(5 * 1024 * 1024)
+        large_size = 5 * 1024 * 1024
         
         with tempfile.NamedTemporaryFile(mode='wb', delete=False) as f:
-            f.write(large_data)
+            f.write(fixture_data(large_size))
             temp_file = f.name
         
         try:
@@ -141,17 +186,14 @@ class TestCryptoManager(unittest.TestCase):
             
             # Проверяем размер
             encrypted_size = os.path.getsize(vault_filename)
-            self.assertGreater(encrypted_size, len(large_data))
+            self.assertGreater(encrypted_size, large_size)
             
             # Дешифруем файл
             output_file = temp_file + ".decrypted"
             self.crypto.decrypt_large_file(vault_filename, output_file)
             
-            # Проверяем содержимое
-            with open(output_file, 'rb') as f:
-                decrypted_data = f.read()
-            
-            self.assertEqual(decrypted_data, large_data)
+            # Проверяем содержимое поблочно, не загружая файлы в память
+            self.assertTrue(filecmp.cmp(output_file, temp_file, shallow=False))
             
             # Очистка
             os.unlink(vault_filename)
@@ -161,24 +203,182 @@ class TestCryptoManager(unittest.TestCase):
             os.unlink(temp_file)
 
 
+class TestCryptoAcceleration(unittest.TestCase):
+    """Тесты аппаратного ускорения AES"""
+    
+    # Архитектуры с аппаратными инструкциями AES (AES-NI / ARMv8 Crypto Extensions)
+    AES_ARCHITECTURES = ('x86_64', 'AMD64', 'aarch64', 'arm64')
+    
+    # Нижняя граница скорости AES-CBC с аппаратным ускорением, МБ/с
+    MIN_HARDWARE_THROUGHPUT = 500
+    
+    def setUp(self):
+        """Пропуск на архитектурах без аппаратного AES"""
+        if platform.machine() not in self.AES_ARCHITECTURES:
+            self.skipTest(f"Архитектура {platform.machine()} не проверяется")
+        
+        self.hardware_aes = has_hardware_aes()
+        if self.hardware_aes is None:
+            self.skipTest("Не удалось прочитать /proc/cpuinfo")
+    
+    def test_cpu_reports_hardware_aes(self):
+        """Тест наличия аппаратного AES у процессора и его поддержки сборкой OpenSSL"""
+        self.assertTrue(self.hardware_aes, "Процессор не сообщает флаг aes")
+        
+        # AES-шифры должны выполняться OpenSSL, а не программной заменой
+        self.assertTrue(
+            openssl_backend.cipher_supported(algorithms.AES(bytes(32)), modes.CBC(bytes(16))),
+            f"{openssl_backend.openssl_version_text()} не поддерживает AES-CBC"
+        )
+    
+    @unittest.skipUnless(os.getenv('RUN_STRESS'), "Нагрузочный тест: задайте RUN_STRESS=1")
+    def test_aes_throughput(self):
+        """Тест скорости AES в используемой сборке OpenSSL"""
+        if not self.hardware_aes:
+            self.skipTest("Процессор без аппаратного AES")
+        
+        # CBC-шифрование последовательно, поэтому программный AES не достигает порога
+        data = bytes(16 * 1024 * 1024)
+        output = bytearray(len(data) + 15)
+        best_time = float('inf')
+        for _ in range(3):
+            encryptor = Cipher(algorithms.AES(os.urandom(32)), modes.CBC(os.urandom(16))).encryptor()
+            start_time = time.perf_counter()
+            encryptor.update_into(data, output)
+            best_time = min(best_time, time.perf_counter() - start_time)
+        
+        throughput = len(data) / best_time / (1024 * 1024)
+        self.assertGreater(
+            throughput,
+            self.MIN_HARDWARE_THROUGHPUT,
+            f"AES-CBC {throughput:.0f} МБ/с: {openssl_backend.openssl_version_text()} "
+            f"не использует аппаратный AES"
+        )
+
+
+class TestEncryptedFileFormat(unittest.TestCase):
+    """Тесты совместимости форматов зашифрованных файлов"""
+    
+    def setUp(self):
+        """Настройка перед каждым тестом"""
+        self.crypto = CryptoManager(Fernet.generate_key())
+        self.test_dir = tempfile.mkdtemp(prefix='file_format_test_')
+    
+    def tearDown(self):
+        """Очистка после каждого теста"""
+        self.crypto.secure_clear()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def test_hash_computed_during_encryption(self):
+        """Тест SHA-256 исходных данных, вычисляемого при шифровании и дешифровании"""
+        test_data = fixture_data(3 * 1024 * 1024 + 17)
+        expected_hash = hashlib.sha256(test_data).hexdigest()
+        source_file = os.path.join(self.test_dir, 'source.bin')
+        with open(source_file, 'wb') as f:
+            f.write(test_data)
+        
+        # Оба формата: AES-GCM целиком и потоковый AES-CTR
+        for encrypt in (self.crypto.encrypt_file, self.crypto.encrypt_large_file):
+            vault_filename, file_id, file_hash = encrypt(source_file, with_hash=True)
+            self.addCleanup(os.unlink, vault_filename)
+            self.assertEqual(file_hash, expected_hash)
+            
+            output_file = os.path.join(self.test_dir, f'{file_id}.decrypted')
+            self.assertEqual(
+                self.crypto.decrypt_file(vault_filename, output_file, with_hash=True),
+                expected_hash
+            )
+    
+    def test_file_mac(self):
+        """Тест ключевого хэша файла для проверки целостности"""
+        test_file = os.path.join(self.test_dir, 'mac.bin')
+        with open(test_file, 'wb') as f:
+            f.write(fixture_data(2 * 1024 * 1024 + 5))
+        
+        # Без пакета blake3 используется BLAKE2b из hashlib
+        file_mac = self.crypto.calculate_file_mac(test_file)
+        algorithm, _, digest = file_mac.partition(':')
+        self.assertIn(algorithm, ('blake3', 'blake2b'))
+        self.assertEqual(len(digest), 64)
+        self.assertEqual(self.crypto.calculate_file_mac(test_file, algorithm), file_mac)
+        
+        # Хэш зависит от мастер-ключа
+        other_crypto = CryptoManager(Fernet.generate_key())
+        self.addCleanup(other_crypto.secure_clear)
+        self.assertNotEqual(other_crypto.calculate_file_mac(test_file, algorithm), file_mac)
+        
+        # И от содержимого файла
+        with open(test_file, 'r+b') as f:
+            f.write(b"X")
+        self.assertNotEqual(self.crypto.calculate_file_mac(test_file, algorithm), file_mac)
+        
+        self.assertIsNone(self.crypto.calculate_file_mac(test_file, 'md5'))
+    
+    def test_decrypt_legacy_fernet_file(self):
+        """Тест дешифрования файла прежнего формата Fernet"""
+        test_data = os.urandom(4096)
+        
+        # Файл прежнего формата: длина ключа, ключ файла, данные Fernet
+        file_key = Fernet.generate_key()
+        encrypted_file_key = self.crypto.encrypt_data(file_key)
+        vault_filename = os.path.join(self.test_dir, 'legacy.myarc')
+        with open(vault_filename, 'wb') as f:
+            f.write(len(encrypted_file_key).to_bytes(4, 'big'))
+            f.write(encrypted_file_key)
+            f.write(Fernet(file_key).encrypt(test_data))
+        
+        output_file = os.path.join(self.test_dir, 'legacy.decrypted')
+        self.crypto.decrypt_file(vault_filename, output_file)
+        
+        with open(output_file, 'rb') as f:
+            self.assertEqual(f.read(), test_data)
+
+
 class TestAuthManager(unittest.TestCase):
     """Тесты менеджера аутентификации"""
     
+    @classmethod
+    def setUpClass(cls):
+        """Общая конфигурация с мастер-паролем создается при первом обращении"""
+        config_dir = tempfile.mkdtemp(prefix='auth_config_')
+        cls.addClassCleanup(shutil.rmtree, config_dir, ignore_errors=True)
+        
+        cls._shared_config_path = os.path.join(config_dir, 'vault_config.json')
+        cls._config_blob = None
+        cls._master_key = None
+    
     def setUp(self):
         """Настройка перед каждым тестом"""
-        self.auth = AuthManager()
         self.test_password = "TestPassword123!"
         self.test_hint = "My favorite color"
         
         # Используем временный файл конфигурации
         self.temp_config = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
-        self.auth.config_path = self.temp_config.name
+        self.temp_config.close()
+        
+        # Файла конфигурации еще нет: AuthManager видит первый запуск, а не пустой JSON
+        os.unlink(self.temp_config.name)
+        self.auth = AuthManager(self.temp_config.name, **_TEST_KDF_PROFILE)
     
     def tearDown(self):
         """Очистка после каждого теста"""
         if os.path.exists(self.temp_config.name):
             os.unlink(self.temp_config.name)
     
+    def _use_shared_config(self):
+        """Копия общей конфигурации с мастер-паролем; возвращает мастер-ключ"""
+        cls = type(self)
+        if cls._config_blob is None:
+            shared_auth = AuthManager(cls._shared_config_path, **_TEST_KDF_PROFILE)
+            cls._master_key = shared_auth.create_master_password(self.test_password, self.test_hint)
+            with open(cls._shared_config_path, 'rb') as f:
+                cls._config_blob = f.read()
+        
+        with open(self.temp_config.name, 'wb') as f:
+            f.write(cls._config_blob)
+        self.auth.config = self.auth._load_config()
+        return cls._master_key
+    
     def test_first_run_detection(self):
         """Тест определения первого запуска"""
         self.assertTrue(self.auth.is_first_run())
@@ -199,8 +399,8 @@ class TestAuthManager(unittest.TestCase):
     
     def test_verify_master_password(self):
         """Тест проверки пароля"""
-        # Создаем пароль
-        self.auth.create_master_password(self.test_password, self.test_hint)
+        # Используем готовую конфигурацию с паролем
+        self._use_shared_config()
         
         # Проверяем правильный пароль
         self.assertTrue(self.auth.verify_master_password(self.test_password))
@@ -210,8 +410,8 @@ class TestAuthManager(unittest.TestCase):
     
     def test_get_master_key(self):
         """Тест получения мастер-ключа"""
-        # Создаем пароль
-        created_key = self.auth.create_master_password(self.test_password, self.test_hint)
+        # Используем готовую конфигурацию с паролем
+        created_key = self._use_shared_config()
         
         # Получаем ключ
         retrieved_key = self.auth.get_master_key(self.test_password)
@@ -240,8 +440,13 @@ class TestAuthManager(unittest.TestCase):
     
     def test_recovery_questions(self):
         """Тест вопросов восстановления"""
-        # Создаем пароль
-        self.auth.create_master_password(self.test_password, self.test_hint)
+        # Используем готовую конфигурацию с паролем
+        self._use_shared_config()
+        
+        # Тест проверяет логику, а не стоимость bcrypt: минимальная стоимость хеша
+        self.auth = AuthManager(
+            self.temp_config.name, recovery_answer_rounds=_TEST_BCRYPT_ROUNDS, **_TEST_KDF_PROFILE
+        )
         
         # Настраиваем вопросы восстановления
         recovery_questions = [
@@ -264,10 +469,42 @@ class TestAuthManager(unittest.TestCase):
             list(zip([q[0] for q in recovery_questions], wrong_answers))
         ))
     
+    def test_kdf_profile_used_in_derivation(self):
+        """Тест: ключ выводится с числом итераций PBKDF2 из профиля"""
+        salt = os.urandom(32)
+        
+        for profile in _KDF_PROFILES.values():
+            auth = AuthManager(self.temp_config.name, **profile)
+            iterations = profile.get('kdf_iterations', 300000)
+            expected_key = base64.urlsafe_b64encode(PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=salt,
+                iterations=iterations
+            ).derive(self.test_password.encode()))
+            
+            self.assertEqual(auth._derive_key_from_password(self.test_password, salt), expected_key)
+        
+        # В тестах по умолчанию используется облегченный профиль
+        if 'AUTH_TEST_KDF_PROFILE' not in os.environ:
+            self.assertEqual(self.auth._kdf_iterations, _KDF_PROFILES['fast']['kdf_iterations'])
+    
+    def test_recovery_answer_uses_real_kdf(self):
+        """Тест параметров хеширования ответов восстановления"""
+        self.assertGreaterEqual(self.auth._recovery_answer_rounds, 12)
+        
+        # Проверяем только параметры вызова, без реального вычисления хеша
+        with patch('auth.bcrypt.hashpw', return_value=b'hash') as mock_hashpw:
+            self.auth._hash_recovery_answer("синий", b'salt')
+        
+        answer_with_salt, salt = mock_hashpw.call_args.args
+        self.assertEqual(answer_with_salt, "синий".encode() + b'salt')
+        self.assertTrue(salt.startswith(b'$2b$%d$' % self.auth._recovery_answer_rounds))
+    
     def test_change_master_password(self):
         """Тест смены пароля"""
-        # Создаем первоначальный пароль
-        old_key = self.auth.create_master_password(self.test_password, self.test_hint)
+        # Используем готовую конфигурацию с первоначальным паролем
+        old_key = self._use_shared_config()
         
         # Меняем пароль
         new_password = "NewPassword456!"
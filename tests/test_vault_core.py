@@ -1,15 +1,41 @@
 # tests/test_vault_core.py - ТЕСТЫ ЯДРА ХРАНИЛИЩА
 import unittest
+import filecmp
 import tempfile
 import os
 import json
+import base64
+import hashlib
 import shutil
+import itertools
+import errno
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch
 
 from vault_core import VaultCore, VaultTransaction, TransactionError
 from auth import AuthManager
 from crypto import CryptoManager
 from folder_security import FolderSecurityManager
+from tests.helpers import setUpModule, tearDownModule
+
+
+# Расшифрованная файловая система для мока: сериализуется один раз на модуль
+_PRISTINE_FS_DICT = {
+    'files': {},
+    'folders': {
+        'root': {
+            'id': 'root',
+            'name': 'Корневая папка',
+            'encrypted_name': '0JrQvtGA0L3QtdC10LLQsNC90Y8g0L/QtdC0',
+            'parent': None,
+            'children': [],
+            'created_at': '2024-01-01T00:00:00',
+            'is_locked': False
+        }
+    }
+}
+_PRISTINE_FS_BYTES = json.dumps(_PRISTINE_FS_DICT, separators=(',', ':')).encode()
 
 
 class TestVaultCore(unittest.TestCase):
@@ -29,36 +55,25 @@ class TestVaultCore(unittest.TestCase):
         self.master_key = b"test_master_key_32_bytes_long!!"
         self.crypto_mock.master_key = self.master_key
         self.crypto_mock.encrypt_with_master_key.return_value = b"encrypted_data"
-        self.crypto_mock.decrypt_with_master_key.return_value = json.dumps({
-            'files': {},
-            'folders': {
-                'root': {
-                    'id': 'root',
-                    'name': 'Корневая папка',
-                    'encrypted_name': '0JrQvtGA0L3QtdC10LLQsNC90Y8g0L/QtdC0',
-                    'parent': None,
-                    'children': [],
-                    'created_at': '2024-01-01T00:00:00',
-                    'is_locked': False
-                }
-            }
-        }).encode()
+        self.crypto_mock.decrypt_with_master_key.return_value = _PRISTINE_FS_BYTES
         
-        self.crypto_mock.encrypt_file.return_value = ('encrypted_file.mya', 'file_id_123')
+        self.crypto_mock.encrypt_file.return_value = ('encrypted_file.mya', 'file_id_123', 'test_hash')
         self.crypto_mock.calculate_file_hash.return_value = 'test_hash'
+        self.crypto_mock.calculate_file_mac.return_value = 'blake2b:test_mac'
         
         self.folder_security_mock.is_folder_unlocked.return_value = True
         self.folder_security_mock.get_folder_key.return_value = None
         
-        # Создаем экземпляр VaultCore
+        # Создаем экземпляр VaultCore в тестовой директории: загрузка при создании
+        # не должна затрагивать data/ в текущей директории
         self.vault = VaultCore(
             self.auth_mock,
             self.crypto_mock,
-            self.folder_security_mock
+            self.folder_security_mock,
+            filesystem_path=os.path.join(self.test_dir, 'filesystem.json.enc'),
+            backup_dir=os.path.join(self.test_dir, 'backups')
         )
-        
-        # Используем тестовую директорию
-        self.vault.filesystem_path = os.path.join(self.test_dir, 'filesystem.json.enc')
+        self.addCleanup(self.vault.cleanup)
     
     def tearDown(self):
         """Очистка после каждого теста"""
@@ -94,6 +109,10 @@ class TestVaultCore(unittest.TestCase):
         
         # Проверяем, что файл добавлен в children корневой папки
         self.assertIn(file_id, self.vault.filesystem['folders']['root']['children'])
+        
+        # Хэш берется из прохода шифрования, файл повторно не читается
+        self.assertEqual(file_data['hash'], 'test_hash')
+        self.crypto_mock.calculate_file_hash.assert_not_called()
     
     def test_add_file_to_folder(self):
         """Тест добавления файла в папку"""
@@ -127,17 +146,26 @@ class TestVaultCore(unittest.TestCase):
     def test_extract_file(self):
         """Тест извлечения файла"""
         # Создаем тестовый файл
+        content = "Test content for extraction".encode('utf-8')
         test_file = os.path.join(self.test_dir, 'source.txt')
-        with open(test_file, 'w', encoding='utf-8') as f:
-            f.write("Test content for extraction")
+        with open(test_file, 'wb') as f:
+            f.write(content)
         
         # Мокируем шифрование и дешифрование
         encrypted_file = os.path.join(self.test_dir, 'encrypted.mya')
         with open(encrypted_file, 'wb') as f:
             f.write(b"encrypted_data")
         
-        self.crypto_mock.encrypt_file.return_value = (encrypted_file, 'test_file_id')
-        self.crypto_mock.decrypt_file.side_effect = lambda src, dst, key: shutil.copy(test_file, dst)
+        # Дешифрование просто записывает известное содержимое, без копирования файла
+        def decrypt_file(src, dst, key, with_hash=False):
+            with open(dst, 'wb') as f:
+                f.write(content)
+            return hashlib.sha256(content).hexdigest()
+        
+        self.crypto_mock.encrypt_file.return_value = (
+            encrypted_file, 'test_file_id', hashlib.sha256(content).hexdigest()
+        )
+        self.crypto_mock.decrypt_file.side_effect = decrypt_file
         
         # Добавляем файл
         file_id = self.vault.add_file(test_file)
@@ -152,10 +180,7 @@ class TestVaultCore(unittest.TestCase):
         self.assertTrue(os.path.exists(extracted_path))
         
         # Проверяем содержимое
-        with open(extracted_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        self.assertEqual(content, "Test content for extraction")
+        self.assertTrue(filecmp.cmp(extracted_path, test_file, shallow=False))
     
     def test_transaction_success(self):
         """Тест успешной транзакции"""
@@ -202,9 +227,19 @@ class TestVaultCore(unittest.TestCase):
         # Проверяем, что состояние откатилось
         self.assertEqual(len(self.vault.filesystem['files']), initial_file_count)
     
-    def test_concurrent_access(self):
-        """Тест конкурентного доступа"""
-        import threading
+    def _unique_encrypt_results(self):
+        """Мок шифрования, выдающий уникальный ID для каждого файла"""
+        counter = itertools.count()
+        
+        def encrypt_file(*args, **kwargs):
+            index = next(counter)
+            return f'encrypted_file_{index}.mya', f'file_id_{index}', 'test_hash'
+        
+        self.crypto_mock.encrypt_file.side_effect = encrypt_file
+    
+    def test_add_file_is_serialization_safe(self):
+        """Тест последовательного добавления файлов"""
+        self._unique_encrypt_results()
         
         # Создаем тестовые файлы
         test_files = []
@@ -214,29 +249,41 @@ class TestVaultCore(unittest.TestCase):
                 f.write(f"Test content {i}")
             test_files.append(test_file)
         
-        # Функция для добавления файлов в потоке
-        def add_files(file_list):
-            for test_file in file_list:
-                try:
-                    self.vault.add_file(test_file)
-                except Exception as e:
-                    print(f"Error in thread: {e}")
-        
-        # Создаем и запускаем потоки
-        threads = []
-        chunk_size = 2
-        for i in range(0, len(test_files), chunk_size):
-            chunk = test_files[i:i + chunk_size]
-            thread = threading.Thread(target=add_files, args=(chunk,))
-            threads.append(thread)
-            thread.start()
-        
-        # Ждем завершения всех потоков
-        for thread in threads:
-            thread.join()
+        # Корректность добавления не зависит от потоков: их проверяет нагрузочный тест
+        for test_file in test_files:
+            self.vault.add_file(test_file)
         
         # Проверяем, что все файлы добавлены
         self.assertEqual(len(self.vault.filesystem['files']), len(test_files))
+        self.assertEqual(
+            len(self.vault.filesystem['folders']['root']['children']),
+            len(test_files)
+        )
+    
+    @unittest.skipUnless(os.getenv('RUN_STRESS'), "Нагрузочный тест: задайте RUN_STRESS=1")
+    def test_add_file_under_contention(self):
+        """Нагрузочный тест конкурентного добавления файлов"""
+        self._unique_encrypt_results()
+        
+        test_file = os.path.join(self.test_dir, 'test.txt')
+        with open(test_file, 'w', encoding='utf-8') as f:
+            f.write("Test content")
+        
+        # Один пул на весь тест: создание потоков не попадает в измерение
+        task_count = 1000
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            file_ids = list(executor.map(
+                lambda _: self.vault.add_file(test_file),
+                range(task_count)
+            ))
+        
+        # Проверяем, что ни одно добавление не потеряно
+        self.assertEqual(len(set(file_ids)), task_count)
+        self.assertEqual(len(self.vault.filesystem['files']), task_count)
+        self.assertEqual(
+            len(self.vault.filesystem['folders']['root']['children']),
+            task_count
+        )
     
     def test_filesystem_backup(self):
         """Тест резервного копирования файловой системы"""
@@ -254,11 +301,80 @@ class TestVaultCore(unittest.TestCase):
         # Проверяем, что файл создан
         self.assertTrue(os.path.exists(self.vault.filesystem_path))
         
-        # Проверяем, что создан бэкап
-        backup_dir = 'data/backups'
-        if os.path.exists(backup_dir):
-            backups = [f for f in os.listdir(backup_dir) if f.startswith('filesystem_backup_')]
-            self.assertGreater(len(backups), 0)
+        # Проверяем, что бэкап создан в директории теста
+        backups = [f for f in os.listdir(self.vault.backup_dir) if f.startswith('filesystem_backup_')]
+        self.assertGreater(len(backups), 0)
+    
+    def test_filesystem_backup_snapshot(self):
+        """Тест снимка файловой системы жесткой ссылкой и копией"""
+        self.vault._save_filesystem()
+        backup_path = self.vault._recent_backups[-1]
+        with open(backup_path, 'rb') as f:
+            snapshot = f.read()
+        self.assertTrue(os.path.samefile(backup_path, self.vault.filesystem_path))
+        
+        # Бэкап не меняется при следующей атомарной записи файловой системы
+        self.vault._atomic_file_operation(self.vault.filesystem_path, lambda f: f.write(b"new data"), 'wb')
+        with open(backup_path, 'rb') as f:
+            self.assertEqual(f.read(), snapshot)
+        
+        # Без жестких ссылок (другой том) файл копируется
+        copy_path = os.path.join(self.test_dir, 'snapshot_copy.enc')
+        with patch('vault_core.os.link', side_effect=OSError(errno.EXDEV, "Cross-device link")):
+            self.vault._snapshot_file(self.vault.filesystem_path, copy_path)
+        self.assertFalse(os.path.samefile(copy_path, self.vault.filesystem_path))
+        self.assertTrue(filecmp.cmp(copy_path, self.vault.filesystem_path, shallow=False))
+    
+    def test_atomic_file_operation_cleanup(self):
+        """Тест удаления временного файла атомарной записи"""
+        atomic_dir = os.path.join(self.test_dir, 'atomic')
+        os.mkdir(atomic_dir)
+        target = os.path.join(atomic_dir, 'atomic.bin')
+        
+        # Успешная запись: временный файл переименован в целевой
+        self.vault._atomic_file_operation(target, lambda f: f.write(b"data"), 'wb', durable=True)
+        self.assertEqual(os.listdir(atomic_dir), ['atomic.bin'])
+        
+        # Ошибка записи: временный файл удален, целевой не изменен
+        def failing_operation(f):
+            f.write(b"partial")
+            raise ValueError("Simulated error")
+        
+        with self.assertRaises(ValueError):
+            self.vault._atomic_file_operation(target, failing_operation, 'wb')
+        self.assertEqual(os.listdir(atomic_dir), ['atomic.bin'])
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b"data")
+    
+    def test_filesystem_backup_rotation(self):
+        """Тест ротации бэкапов файловой системы без повторного сканирования"""
+        self.vault._max_filesystem_backups = 3
+        
+        # Новая директория бэкапов сканируется при первом сохранении в нее
+        self.vault.backup_dir = os.path.join(self.test_dir, 'rotation_backups')
+        os.makedirs(self.vault.backup_dir)
+        
+        # Старые бэкапы с возрастающим временем изменения
+        old_backups = []
+        for i in range(4):
+            path = os.path.join(self.vault.backup_dir, f'filesystem_backup_2000010{i}_000000.json.enc')
+            with open(path, 'wb') as f:
+                f.write(b"old backup")
+            os.utime(path, (946684800 + i, 946684800 + i))
+            old_backups.append(path)
+        
+        self.vault._save_filesystem()
+        
+        # Остаются два самых новых старых бэкапа и только что созданный
+        remaining = sorted(os.listdir(self.vault.backup_dir))
+        self.assertEqual(len(remaining), 3)
+        self.assertEqual(remaining[:2], [os.path.basename(path) for path in old_backups[2:]])
+        
+        # Следующие сохранения не сканируют директорию заново
+        with patch('vault_core.os.scandir', wraps=os.scandir) as mock_scandir:
+            self.vault._save_filesystem()
+        mock_scandir.assert_not_called()
+        self.assertEqual(len(os.listdir(self.vault.backup_dir)), 3)
     
     def test_integrity_check(self):
         """Тест проверки целостности"""
@@ -276,6 +392,78 @@ class TestVaultCore(unittest.TestCase):
         # Не должно быть проблем
         self.assertEqual(len(issues), 0)
     
+    def test_integrity_check_parallel(self):
+        """Тест параллельной проверки целостности нескольких файлов"""
+        files = self.vault.filesystem['files']
+        for i in range(8):
+            vault_path = os.path.join(self.test_dir, f'file_{i}.mya')
+            with open(vault_path, 'wb') as f:
+                f.write(f"content {i}".encode())
+            files[f'file_{i}'] = {'vault_filename': vault_path, 'hash': f"hash {i}"}
+        files['file_3']['hash'] = "wrong hash"
+        files['file_missing'] = {'vault_filename': os.path.join(self.test_dir, 'missing.mya'), 'hash': ""}
+        
+        # "Хэш" файла - его содержимое с заменой content на hash
+        def decrypt_file(src, dst, key, with_hash=False):
+            with open(src, 'rb') as f:
+                return f.read().decode().replace("content", "hash")
+        
+        self.crypto_mock.decrypt_file.side_effect = decrypt_file
+        
+        issues = self.vault.verify_integrity()
+        
+        self.assertEqual(issues, [
+            "Файл file_3: хэш не совпадает",
+            "Файл file_missing: зашифрованный файл не найден",
+        ])
+        self.assertEqual(self.crypto_mock.decrypt_file.call_count, 8)
+    
+    def test_integrity_check_file_mac(self):
+        """Тест проверки целостности по ключевому хэшу без дешифрования"""
+        vault_path = os.path.join(self.test_dir, 'file.mya')
+        with open(vault_path, 'wb') as f:
+            f.write(b"encrypted_data")
+        files = self.vault.filesystem['files']
+        files['file_1'] = {'vault_filename': vault_path, 'hash': 'test_hash', 'mac': 'blake3:test_mac'}
+        
+        # Ключевой хэш совпадает - файл не расшифровывается
+        self.crypto_mock.calculate_file_mac.return_value = 'blake3:test_mac'
+        self.assertEqual(self.vault.verify_integrity(), [])
+        self.crypto_mock.calculate_file_mac.assert_called_once_with(vault_path, 'blake3')
+        self.crypto_mock.decrypt_file.assert_not_called()
+        
+        # Ключевой хэш не совпадает
+        self.crypto_mock.calculate_file_mac.return_value = 'blake3:other_mac'
+        self.assertEqual(self.vault.verify_integrity(), ["Файл file_1: хэш не совпадает"])
+        self.crypto_mock.decrypt_file.assert_not_called()
+        
+        # Алгоритм недоступен - проверка дешифрованием и SHA-256
+        self.crypto_mock.calculate_file_mac.return_value = None
+        self.crypto_mock.decrypt_file.return_value = 'test_hash'
+        self.assertEqual(self.vault.verify_integrity(), [])
+        self.crypto_mock.decrypt_file.assert_called_once()
+    
+    def test_integrity_check_temp_location(self):
+        """Тест: расшифровка при проверке целостности пишется в директорию данных хранилища"""
+        vault_path = os.path.join(self.test_dir, 'file.mya')
+        with open(vault_path, 'wb') as f:
+            f.write(b"encrypted_data")
+        self.vault.filesystem['files']['file_1'] = {'vault_filename': vault_path, 'hash': 'test_hash'}
+        
+        temp_dirs = []
+        
+        def decrypt_file(src, dst, key, with_hash=False):
+            temp_dirs.append(os.path.dirname(dst))
+            return 'test_hash'
+        
+        self.crypto_mock.decrypt_file.side_effect = decrypt_file
+        
+        self.assertEqual(self.vault.verify_integrity(), [])
+        self.assertEqual(temp_dirs, [os.path.dirname(self.vault.filesystem_path)])
+        
+        # Временный файл удален после проверки
+        self.assertFalse([name for name in os.listdir(self.test_dir) if name.startswith('verify_')])
+    
     def test_corrupted_filesystem_recovery(self):
         """Тест восстановления из поврежденной файловой системы"""
         # Сохраняем текущую файловую систему
@@ -290,6 +478,102 @@ class TestVaultCore(unittest.TestCase):
         
         # Проверяем, что файловая система загружена
         self.assertIn('root', self.vault.filesystem['folders'])
+    
+    def test_folder_contents_cache(self):
+        """Тест кэша содержимого папок с точечным сбросом"""
+        self._unique_encrypt_results()
+        
+        # Повторный запрос обслуживается из кэша
+        contents = self.vault.get_folder_contents('root')
+        self.assertIs(self.vault.get_folder_contents('root'), contents)
+        self.assertEqual(contents, ([], []))
+        
+        # Сохранение не сбрасывает кэш
+        self.vault._save_filesystem()
+        self.assertIs(self.vault.get_folder_contents('root'), contents)
+        
+        # Добавление файла сбрасывает кэш только своей папки
+        test_file = os.path.join(self.test_dir, 'test.txt')
+        with open(test_file, 'w', encoding='utf-8') as f:
+            f.write("Test content")
+        file_id = self.vault.add_file(test_file)
+        
+        subfolders, files = self.vault.get_folder_contents('root')
+        self.assertEqual(subfolders, [])
+        self.assertEqual([file['id'] for file in files], [file_id])
+    
+    def test_filesystem_binary_payload_roundtrip(self):
+        """Тест сохранения и загрузки файловой системы в бинарном кадре"""
+        # Шифрование без преобразования, чтобы проверить сам кадр
+        self.crypto_mock.encrypt_with_master_key.side_effect = lambda data: data
+        self.crypto_mock.decrypt_with_master_key.side_effect = lambda data: data
+        
+        self.vault.filesystem['files']['file_1'] = {'id': 'file_1', 'folder_id': 'root'}
+        self.vault.filesystem['folders']['root']['children'].append('file_1')
+        expected = json.loads(json.dumps(self.vault.filesystem))
+        self.vault._save_filesystem()
+        
+        with open(self.vault.filesystem_path, 'rb') as f:
+            self.assertEqual(f.read(4), b'VLT2')
+        
+        self.vault.filesystem = {}
+        self.vault._load_filesystem()
+        self.assertEqual(self.vault.filesystem, expected)
+    
+    def test_load_legacy_json_payload(self):
+        """Тест загрузки файловой системы в прежней JSON-обертке"""
+        self.crypto_mock.decrypt_with_master_key.side_effect = lambda data: data
+        
+        filesystem = json.loads(_PRISTINE_FS_BYTES)
+        filesystem['files']['legacy_file'] = {'id': 'legacy_file', 'folder_id': 'root'}
+        filesystem['folders']['root']['children'].append('legacy_file')
+        data = json.dumps(filesystem).encode()
+        payload = json.dumps({
+            'data': base64.b64encode(data).decode(),
+            'checksum': base64.b64encode(hashlib.sha256(data).digest()).decode(),
+            'timestamp': '2024-01-01T00:00:00',
+            'version': '2.0'
+        }).encode()
+        with open(self.vault.filesystem_path, 'wb') as f:
+            f.write(payload)
+        
+        self.vault._load_filesystem()
+        self.assertEqual(self.vault.filesystem['folders']['root']['children'], ['legacy_file'])
+    
+    def test_get_file_type(self):
+        """Тест определения типа файла по расширению"""
+        cases = {
+            'photo.JPG': 'image',
+            'movie.mp4': 'video',
+            'song.mp3': 'audio',
+            'report.pdf': 'document',
+            'notes.md': 'text',
+            'data.json': 'text',
+            'archive.tar.gz': 'archive',
+            'dir.with.dots/file': 'binary',
+            'program.exe': 'binary',
+        }
+        for file_path, expected in cases.items():
+            self.assertEqual(self.vault._get_file_type(file_path), expected, file_path)
+    
+    def test_restore_from_backup_reuses_ciphertext(self):
+        """Тест восстановления из бэкапа без повторного шифрования"""
+        self.crypto_mock.encrypt_with_master_key.side_effect = lambda data: data
+        self.crypto_mock.decrypt_with_master_key.side_effect = lambda data: data
+        
+        self.vault.filesystem['files']['file_1'] = {'id': 'file_1', 'folder_id': 'root'}
+        self.vault.filesystem['folders']['root']['children'].append('file_1')
+        self.vault._save_filesystem()
+        backup_path = os.path.join(self.test_dir, 'restore_backup.enc')
+        shutil.copyfile(self.vault.filesystem_path, backup_path)
+        
+        self.vault.filesystem = json.loads(_PRISTINE_FS_BYTES)
+        self.crypto_mock.encrypt_with_master_key.reset_mock()
+        self.vault._restore_from_backup(backup_path)
+        
+        self.crypto_mock.encrypt_with_master_key.assert_not_called()
+        self.assertEqual(self.vault.filesystem['folders']['root']['children'], ['file_1'])
+        self.assertTrue(filecmp.cmp(self.vault.filesystem_path, backup_path, shallow=False))
 
 
 class TestVaultTransaction(unittest.TestCase):
@@ -298,7 +582,10 @@ class TestVaultTransaction(unittest.TestCase):
     def setUp(self):
         """Настройка перед каждым тестом"""
         self.vault_mock = Mock(spec=VaultCore)
+        self.vault_mock.backup_dir = tempfile.mkdtemp(prefix='vault_tx_test_')
+        self.addCleanup(shutil.rmtree, self.vault_mock.backup_dir, ignore_errors=True)
         self.vault_mock.filesystem = {'files': {}, 'folders': {'root': {'children': []}}}
+        self.vault_mock._filesystem_lock = threading.RLock()
     
     def test_transaction_commit(self):
         """Тест коммита транзакции"""
@@ -320,6 +607,50 @@ class TestVaultTransaction(unittest.TestCase):
         # Проверяем, что состояние транзакции изменилось
         self.assertEqual(transaction._state, 'committed')
     
+    def test_operation_ids_unique(self):
+        """Тест уникальности ID операций в транзакции"""
+        transaction = VaultTransaction(self.vault_mock, "test")
+        
+        operation_ids = [transaction.add_file(f"/path/to/file_{i}.txt") for i in range(3)]
+        operation_ids.append(transaction.create_folder("folder"))
+        operation_ids.append(transaction.delete_file("file_id"))
+        
+        self.assertEqual(len(set(operation_ids)), len(operation_ids))
+        self.assertEqual(operation_ids[0], "add_file_0")
+        self.assertEqual(operation_ids[-1], "delete_file_4")
+    
+    def test_transaction_syncs_added_files_once(self):
+        """Тест групповой синхронизации файлов при коммите"""
+        with patch.object(VaultTransaction, '_create_backup'):
+            transaction = VaultTransaction(self.vault_mock, "test")
+            transaction.add_file("/path/to/first.txt", "root")
+            transaction.add_file("/path/to/second.txt", "root")
+        
+            self.vault_mock._transactional_add_file.side_effect = ["file_id_1", "file_id_2"]
+            transaction.commit()
+        
+        # Файлы пишутся без fsync и синхронизируются одним вызовом
+        for call in self.vault_mock._transactional_add_file.call_args_list:
+            self.assertFalse(call.kwargs['sync'])
+        self.vault_mock._sync_vault_files.assert_called_once_with(["file_id_1", "file_id_2"])
+    
+    def test_transaction_saves_filesystem_once(self):
+        """Тест однократного сохранения файловой системы при коммите"""
+        with patch.object(VaultTransaction, '_create_backup'):
+            transaction = VaultTransaction(self.vault_mock, "test")
+            for i in range(3):
+                transaction.add_file(f"/path/to/file_{i}.txt", "root")
+            
+            self.vault_mock._transactional_add_file.side_effect = ["file_id_1", "file_id_2", "file_id_3"]
+            transaction.commit()
+        
+        # Операции меняют только состояние в памяти, запись на диск одна
+        self.vault_mock._save_filesystem.assert_called_once_with()
+        
+        # Файлы синхронизируются до сохранения ссылающихся на них метаданных
+        call_names = [name for name, _, _ in self.vault_mock.mock_calls]
+        self.assertLess(call_names.index('_sync_vault_files'), call_names.index('_save_filesystem'))
+    
     def test_transaction_rollback_on_error(self):
         """Тест отката транзакции при ошибке"""
         transaction = VaultTransaction(self.vault_mock, "test")
@@ -337,6 +668,32 @@ class TestVaultTransaction(unittest.TestCase):
         # Проверяем, что состояние транзакции - failed
         self.assertEqual(transaction._state, 'failed')
     
+    def test_rollback_restores_in_memory_snapshot(self):
+        """Тест отката по снимку в памяти без записи бэкапа на диск"""
+        self.vault_mock.filesystem['files']['existing'] = {'id': 'existing', 'folder_id': 'root'}
+        self.vault_mock.filesystem['folders']['root']['children'].append('existing')
+        expected = json.loads(json.dumps(self.vault_mock.filesystem))
+        
+        def add_file(file_path, folder_id, progress_callback, sync):
+            # Первая операция меняет файловую систему, вторая падает
+            if file_path.endswith('broken.txt'):
+                raise ValueError("Test error")
+            self.vault_mock.filesystem['files']['new_file'] = {'id': 'new_file', 'folder_id': folder_id}
+            self.vault_mock.filesystem['folders'][folder_id]['children'].append('new_file')
+            return 'new_file'
+        
+        self.vault_mock._transactional_add_file.side_effect = add_file
+        
+        transaction = VaultTransaction(self.vault_mock, "test")
+        transaction.add_file("/path/to/file.txt", "root")
+        transaction.add_file("/path/to/broken.txt", "root")
+        with self.assertRaises(TransactionError):
+            transaction.commit()
+        
+        self.assertEqual(self.vault_mock.filesystem, expected)
+        self.vault_mock._invalidate_folder_cache.assert_called_once_with('root')
+        self.assertEqual(os.listdir(self.vault_mock.backup_dir), [])
+    
     def test_transaction_context_manager(self):
         """Тест контекстного менеджера транзакции"""
         with patch.object(VaultTransaction, 'commit') as mock_commit:
@@ -6,14 +6,124 @@ import shutil
 import logging
 import threading
 import tempfile
-import secrets
+import itertools
 import time
 import hashlib
+import hmac
+import struct
+import mimetypes
 from datetime import datetime
-from collections import OrderedDict
-from functools import lru_cache
+from collections import OrderedDict, deque
 from threading import RLock
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+
+from securestring import SecureTempFile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Кодировщик создается один раз: json.dumps с аргументами собирает новый на каждый вызов
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def _dumps_json(data):
+    """Сериализация метаданных хранилища в UTF-8 (orjson, если установлен)"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return _JSON_ENCODER.encode(data).encode()
+
+
+# Бинарный кадр файловой системы: сигнатура, версия, время (нс), длина данных, SHA-256
+_FILESYSTEM_MAGIC = b'VLT2'
+_FILESYSTEM_VERSION = 2
+_FILESYSTEM_HEADER = struct.Struct('<4sHQQ32s')
+
+
+def _pack_filesystem_payload(data):
+    """Упаковка JSON файловой системы в бинарный кадр с контрольной суммой"""
+    checksum = hashlib.sha256(data).digest()
+    header = _FILESYSTEM_HEADER.pack(
+        _FILESYSTEM_MAGIC, _FILESYSTEM_VERSION, time.time_ns(), len(data), checksum
+    )
+    return header + data
+
+
+def _unpack_filesystem_payload(payload):
+    """JSON файловой системы из бинарного кадра или прежней JSON-обертки с base64"""
+    if payload[:len(_FILESYSTEM_MAGIC)] == _FILESYSTEM_MAGIC:
+        _, version, _, length, expected_checksum = _FILESYSTEM_HEADER.unpack_from(payload)
+        if version != _FILESYSTEM_VERSION:
+            raise ValueError("Несовместимая версия файловой системы")
+        
+        # Срез memoryview не копирует данные; orjson разбирает его напрямую
+        data = memoryview(payload)[_FILESYSTEM_HEADER.size:]
+        if len(data) != length:
+            raise ValueError("Длина данных файловой системы не совпадает")
+    else:
+        wrapper = _loads_json(payload)
+        
+        # Проверяем версию формата
+        if wrapper.get('version') != '2.0':
+            raise ValueError("Несовместимая версия файловой системы")
+        
+        data = base64.b64decode(wrapper['data'])
+        expected_checksum = base64.b64decode(wrapper['checksum'])
+    
+    # Проверяем контрольную сумму
+    if hashlib.sha256(data).digest() != expected_checksum:
+        raise ValueError("Контрольная сумма не совпадает")
+    return data
+
+
+_DOCUMENT_MIME_TYPES = frozenset((
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+))
+
+
+def _file_type_from_mime(mime_type):
+    """Тип файла по MIME-типу (None, если тип не распознан)"""
+    if not mime_type:
+        return None
+    if mime_type.startswith('image/'):
+        return 'image'
+    if mime_type.startswith('video/'):
+        return 'video'
+    if mime_type.startswith('audio/'):
+        return 'audio'
+    if mime_type in _DOCUMENT_MIME_TYPES:
+        return 'document'
+    return None
+
+
+def _build_file_type_map():
+    """Таблица расширение -> тип файла, собранная один раз при импорте"""
+    mimetypes.init()
+    file_types = dict.fromkeys(('.txt', '.log', '.md', '.json', '.xml', '.html', '.htm'), 'text')
+    file_types.update(dict.fromkeys(('.zip', '.rar', '.7z', '.tar', '.gz'), 'archive'))
+    
+    # MIME-тип имеет приоритет над расширением, как и в mimetypes.guess_type
+    for ext, mime_type in mimetypes.types_map.items():
+        file_type = _file_type_from_mime(mime_type)
+        if file_type:
+            file_types[ext] = file_type
+    return file_types
+
+
+_EXT_TO_FILE_TYPE = _build_file_type_map()
+
+
+def _loads_json(data):
+    """Разбор метаданных хранилища прямо из байтов, без промежуточного decode()"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
 
 
 class VaultTransaction:
@@ -25,8 +135,9 @@ class VaultTransaction:
         self.operations = []
         self._state = 'initialized'
         self._lock = threading.RLock()
-        self._backup_files = []
         self._rollback_data = {}
+        # ID операций уникальны в пределах транзакции, криптостойкость не нужна
+        self._op_counter = itertools.count()
     
     def add_file(self, file_path, folder_id='root', progress_callback=None):
         """Добавление файла в транзакцию"""
@@ -34,7 +145,7 @@ class VaultTransaction:
             if self._state != 'initialized':
                 raise RuntimeError("Транзакция уже выполнена")
             
-            operation_id = f"add_file_{secrets.token_hex(8)}"
+            operation_id = f"add_file_{next(self._op_counter)}"
             self.operations.append({
                 'id': operation_id,
                 'type': 'add_file',
@@ -50,7 +161,7 @@ class VaultTransaction:
             if self._state != 'initialized':
                 raise RuntimeError("Транзакция уже выполнена")
             
-            operation_id = f"create_folder_{secrets.token_hex(8)}"
+            operation_id = f"create_folder_{next(self._op_counter)}"
             self.operations.append({
                 'id': operation_id,
                 'type': 'create_folder',
@@ -68,7 +179,7 @@ class VaultTransaction:
             if self._state != 'initialized':
                 raise RuntimeError("Транзакция уже выполнена")
             
-            operation_id = f"delete_file_{secrets.token_hex(8)}"
+            operation_id = f"delete_file_{next(self._op_counter)}"
             self.operations.append({
                 'id': operation_id,
                 'type': 'delete_file',
@@ -86,7 +197,7 @@ class VaultTransaction:
             results = {}
             
             try:
-                # Создаем резервную копию файловой системы
+                # Снимок файловой системы для отката
                 self._create_backup()
                 
                 # Выполняем операции
@@ -101,7 +212,25 @@ class VaultTransaction:
                         self._state = 'failed'
                         raise TransactionError(f"Транзакция прервана: {e}")
                 
+                # Групповая синхронизация: добавленные файлы сбрасываются на диск один раз за транзакцию
+                added_file_ids = [
+                    results[op['id']] for op in self.operations if op['type'] == 'add_file'
+                ]
+                if added_file_ids:
+                    self.vault._sync_vault_files(added_file_ids)
+                
+                # Метаданные сохраняются один раз за транзакцию, когда файлы уже на диске
+                try:
+                    self.vault._save_filesystem()
+                except Exception as e:
+                    logging.error(f"Ошибка сохранения файловой системы: {e}")
+                    self._state = 'rolling_back'
+                    self._rollback()
+                    self._state = 'failed'
+                    raise TransactionError(f"Транзакция прервана: {e}")
+                
                 self._state = 'committed'
+                self._rollback_data = {}
                 logging.info(f"Транзакция '{self.description}' успешно выполнена")
                 return results
                 
@@ -117,7 +246,8 @@ class VaultTransaction:
             return self.vault._transactional_add_file(
                 operation['file_path'],
                 operation['folder_id'],
-                operation['progress_callback']
+                operation['progress_callback'],
+                sync=False
             )
         elif op_type == 'create_folder':
             return self.vault._transactional_create_folder(
@@ -133,44 +263,56 @@ class VaultTransaction:
             raise ValueError(f"Неизвестный тип операции: {op_type}")
     
     def _create_backup(self):
-        """Создание резервной копии для отката"""
-        try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-            backup_name = f"transaction_backup_{timestamp}_{secrets.token_hex(4)}.json.enc"
-            backup_path = os.path.join('data/backups', backup_name)
-            
-            os.makedirs('data/backups', exist_ok=True)
-            
-            # Шифруем резервную копию
-            data = json.dumps(self.vault.filesystem, ensure_ascii=False).encode()
-            encrypted_data = self.vault.crypto.encrypt_with_master_key(data)
-            
-            with open(backup_path, 'wb') as f:
-                f.write(encrypted_data)
-            
-            self._backup_files.append(backup_path)
-            logging.debug(f"Создана резервная копия: {backup_path}")
-            
-        except Exception as e:
-            logging.error(f"Ошибка создания резервной копии: {e}")
-            raise
+        """Снимок файловой системы в памяти для отката"""
+        with self.vault._filesystem_lock:
+            filesystem = self.vault.filesystem
+            files = filesystem.get('files', {})
+            folders = filesystem.get('folders', {})
+            
+            # Папки, чьи списки детей меняют операции транзакции
+            touched_folders = set()
+            for op in self.operations:
+                if op['type'] == 'add_file':
+                    touched_folders.add(op['folder_id'])
+                elif op['type'] == 'create_folder':
+                    touched_folders.add(op['parent_id'])
+                elif op['type'] == 'delete_file':
+                    touched_folders.add(files.get(op['file_id'], {}).get('folder_id'))
+            
+            # Словари копируются поверхностно (копия ссылок выполняется в C),
+            # глубоко копируются только затрагиваемые папки
+            self._rollback_data = {
+                'files': dict(files),
+                'folders': dict(folders),
+                'touched_folders': {
+                    folder_id: {**folders[folder_id], 'children': list(folders[folder_id].get('children', []))}
+                    for folder_id in touched_folders if folder_id in folders
+                },
+            }
     
     def _rollback(self):
         """Откат транзакции"""
         logging.warning(f"Откат транзакции '{self.description}'")
         
         try:
-            # Восстанавливаем из последней резервной копии
-            if self._backup_files:
-                latest_backup = self._backup_files[-1]
-                self.vault._restore_from_backup(latest_backup)
-            
-            # Очищаем резервные копии
-            for backup in self._backup_files:
-                try:
-                    os.remove(backup)
-                except:
-                    pass
+            # Восстанавливаем состояние из снимка в памяти: до коммита на диск ничего не записано
+            if self._rollback_data:
+                with self.vault._filesystem_lock:
+                    filesystem = self.vault.filesystem
+                    folders = filesystem.setdefault('folders', {})
+                    # Сбросить кэш нужно у затронутых и у созданных транзакцией папок
+                    changed_folders = set(self._rollback_data['touched_folders'])
+                    changed_folders.update(folders.keys() - self._rollback_data['folders'].keys())
+                    
+                    files = filesystem.setdefault('files', {})
+                    files.clear()
+                    files.update(self._rollback_data['files'])
+                    folders.clear()
+                    folders.update(self._rollback_data['folders'])
+                    folders.update(self._rollback_data['touched_folders'])
+                
+                self.vault._invalidate_folder_cache(*changed_folders)
+                self._rollback_data = {}
             
         except Exception as e:
             logging.error(f"Ошибка при откате транзакции: {e}")
@@ -198,11 +340,13 @@ class TransactionError(Exception):
 
 
 class SecureVaultCore:
-    def __init__(self, auth_manager, crypto_manager, folder_security_manager):
+    def __init__(self, auth_manager, crypto_manager, folder_security_manager,
+                 filesystem_path='data/filesystem.json.enc', backup_dir='data/backups'):
         self.auth = auth_manager
         self.crypto = crypto_manager
         self.folder_security_manager = folder_security_manager
-        self.filesystem_path = 'data/filesystem.json.enc'
+        self.filesystem_path = filesystem_path
+        self.backup_dir = backup_dir
         self.filesystem = {}
         self.current_folder_id = 'root'
         
@@ -210,138 +354,146 @@ class SecureVaultCore:
         self._folder_cache = OrderedDict()
         self._cache_max_size = 100
         
+        # Бэкапы файловой системы от старых к новым (читаются с диска один раз)
+        self._recent_backups = None
+        self._recent_backups_dir = None
+        self._max_filesystem_backups = 10
+        
         # Улучшенная блокировка
         self._filesystem_lock = RLock()
         self._transaction_lock = threading.Lock()
         self._file_locks = {}  # file_id -> lock
         self._folder_locks = {}  # folder_id -> lock
         
-        # Очередь операций
-        self._operation_queue = Queue()
-        self._operation_worker = threading.Thread(
-            target=self._process_operations,
-            daemon=True
-        )
-        self._operation_worker.start()
-        
         self._load_filesystem()
     
-    def _process_operations(self):
-        """Обработка операций в очереди"""
-        while True:
-            try:
-                operation = self._operation_queue.get()
-                if operation is None:  # Сигнал остановки
-                    break
-                
-                func, args, kwargs, result_queue = operation
-                try:
-                    result = func(*args, **kwargs)
-                    result_queue.put(('success', result))
-                except Exception as e:
-                    result_queue.put(('error', e))
-                finally:
-                    self._operation_queue.task_done()
-                    
-            except Exception as e:
-                logging.error(f"Ошибка в обработчике операций: {e}")
+    def get_folder_contents(self, folder_id):
+        """Подпапки и файлы папки для отображения (результат кэшируется, не изменять)"""
+        with self._filesystem_lock:
+            contents = self._folder_cache.get(folder_id)
+            if contents is not None:
+                self._folder_cache.move_to_end(folder_id)
+                return contents
+            
+            folders = self.filesystem['folders']
+            files = self.filesystem['files']
+            subfolders = []
+            folder_files = []
+            for child_id in folders[folder_id]['children']:
+                if child_id in folders:
+                    folder = folders[child_id]
+                    subfolders.append({
+                        'id': child_id,
+                        'name': base64.b64decode(folder['encrypted_name']).decode(),
+                        'is_locked': folder.get('is_locked', True),
+                        'created_at': folder.get('created_at', '')
+                    })
+                elif child_id in files:
+                    file = files[child_id]
+                    folder_files.append({
+                        'id': child_id,
+                        'name': file['original_name'],
+                        'file_type': file['file_type'],
+                        'size': file['size'],
+                        'added_at': file['added_at']
+                    })
+            
+            contents = (subfolders, folder_files)
+            self._folder_cache[folder_id] = contents
+            if len(self._folder_cache) > self._cache_max_size:
+                self._folder_cache.popitem(last=False)
+            return contents
     
-    def _queue_operation(self, func, *args, **kwargs):
-        """Добавление операции в очередь"""
-        result_queue = Queue()
-        self._operation_queue.put((func, args, kwargs, result_queue))
-        
-        result_type, result = result_queue.get()
-        if result_type == 'error':
-            raise result
-        return result
+    def _invalidate_folder_cache(self, *folder_ids):
+        """Сброс кэша содержимого только для измененных папок"""
+        with self._filesystem_lock:
+            for folder_id in folder_ids:
+                self._folder_cache.pop(folder_id, None)
     
     def _get_file_lock(self, file_id):
         """Получение блокировки для файла"""
-        with self._filesystem_lock:
-            if file_id not in self._file_locks:
-                self._file_locks[file_id] = threading.RLock()
-            return self._file_locks[file_id]
+        # dict.setdefault атомарен, общая блокировка файловой системы не нужна
+        lock = self._file_locks.get(file_id)
+        if lock is None:
+            lock = self._file_locks.setdefault(file_id, threading.RLock())
+        return lock
     
     def _get_folder_lock(self, folder_id):
         """Получение блокировки для папки"""
-        with self._filesystem_lock:
-            if folder_id not in self._folder_locks:
-                self._folder_locks[folder_id] = threading.RLock()
-            return self._folder_locks[folder_id]
+        lock = self._folder_locks.get(folder_id)
+        if lock is None:
+            lock = self._folder_locks.setdefault(folder_id, threading.RLock())
+        return lock
     
-    def _atomic_file_operation(self, filepath, operation_callback, mode='rb'):
-        """Атомарные файловые операции с защитой от race conditions"""
+    def _atomic_file_operation(self, filepath, operation_callback, mode='rb', durable=False):
+        """Атомарные файловые операции с защитой от race conditions (durable=True - с fsync)"""
         dirname = os.path.dirname(filepath)
         basename = os.path.basename(filepath)
         
         # Создаем временный файл в той же директории
         fd, temp_path = tempfile.mkstemp(prefix=f".{basename}.tmp", dir=dirname)
+        replaced = False
         
         try:
             with os.fdopen(fd, 'wb' if 'b' in mode else 'w') as temp_file:
                 result = operation_callback(temp_file)
+                if durable:
+                    temp_file.flush()
+                    getattr(os, 'fdatasync', os.fsync)(temp_file.fileno())
             
-            # Многократные попытки атомарной замены
+            # Многократные попытки атомарной замены с короткой экспоненциальной паузой
             max_attempts = 5
             for attempt in range(max_attempts):
                 try:
                     os.replace(temp_path, filepath)
+                    replaced = True
                     break
                 except PermissionError:
                     if attempt == max_attempts - 1:
                         raise
-                    time.sleep(0.1 * (attempt + 1))
+                    time.sleep(min(0.001 * (1 << attempt), 0.05))
+            
+            # Запись о переименовании фиксируется синхронизацией директории
+            if durable:
+                self._fsync_directory(dirname)
             
             return result
             
-        except Exception:
-            # Очистка при ошибке
-            try:
-                os.unlink(temp_path)
-            except OSError:
-                pass
-            raise
         finally:
-            # Гарантируем удаление временного файла
-            if os.path.exists(temp_path):
+            # Временный файл остается только если замена не состоялась
+            if not replaced:
                 try:
                     os.unlink(temp_path)
-                except OSError:
+                except FileNotFoundError:
                     pass
     
+    @staticmethod
+    def _fsync_directory(dirname):
+        """Синхронизация директории после переименования (на Windows не поддерживается)"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        dir_fd = os.open(dirname or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
     def _save_filesystem(self):
         """Безопасное сохранение файловой системы с контрольной суммой"""
         with self._filesystem_lock:
             try:
                 def write_operation(temp_file):
-                    # Добавляем контрольную сумму
-                    data = json.dumps(self.filesystem, ensure_ascii=False).encode()
-                    checksum = hashlib.sha256(data).digest()
-                    
-                    # Сохраняем с контрольной суммой
-                    payload = {
-                        'data': base64.b64encode(data).decode(),
-                        'checksum': base64.b64encode(checksum).decode(),
-                        'timestamp': datetime.now().isoformat(),
-                        'version': '2.0'
-                    }
-                    
-                    payload_data = json.dumps(payload, ensure_ascii=False).encode()
-                    encrypted_data = self.crypto.encrypt_with_master_key(payload_data)
+                    # Сохраняем в бинарном кадре с контрольной суммой
+                    payload = _pack_filesystem_payload(_dumps_json(self.filesystem))
+                    encrypted_data = self.crypto.encrypt_with_master_key(payload)
                     temp_file.write(encrypted_data)
                 
                 os.makedirs(os.path.dirname(self.filesystem_path), exist_ok=True)
-                self._atomic_file_operation(self.filesystem_path, write_operation, 'wb')
+                self._atomic_file_operation(self.filesystem_path, write_operation, 'wb', durable=True)
                 
                 # Создаем резервную копию
                 self._create_filesystem_backup()
                 
-                # Очищаем кэш после сохранения
-                self._folder_cache.clear()
-                if hasattr(self, 'get_folder_contents_cached'):
-                    self.get_folder_contents_cached.cache_clear()
-                    
             except Exception as e:
                 logging.error(f"Ошибка сохранения файловой системы: {e}")
                 raise e
@@ -351,32 +503,83 @@ class SecureVaultCore:
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_name = f"filesystem_backup_{timestamp}.json.enc"
-            backup_path = os.path.join('data/backups', backup_name)
+            backup_path = os.path.join(self.backup_dir, backup_name)
             
-            os.makedirs('data/backups', exist_ok=True)
+            os.makedirs(self.backup_dir, exist_ok=True)
             
-            # Копируем файл
+            # Список бэкапов сканируется один раз, дальше ведется в памяти
+            if self._recent_backups is None or self._recent_backups_dir != self.backup_dir:
+                self._recent_backups = deque(self._scan_filesystem_backups())
+                self._recent_backups_dir = self.backup_dir
+            
+            # Снимок файла (жесткая ссылка или копия)
             if os.path.exists(self.filesystem_path):
-                shutil.copy2(self.filesystem_path, backup_path)
+                self._snapshot_file(self.filesystem_path, backup_path)
                 logging.debug(f"Создана резервная копия файловой системы: {backup_path}")
+                
+                # Повторное сохранение в ту же секунду перезаписывает тот же бэкап
+                if backup_path in self._recent_backups:
+                    self._recent_backups.remove(backup_path)
+                self._recent_backups.append(backup_path)
             
             # Очищаем старые бэкапы (оставляем последние 10)
-            backups = []
-            for f in os.listdir('data/backups'):
-                if f.startswith('filesystem_backup_'):
-                    full_path = os.path.join('data/backups', f)
-                    backups.append((os.path.getmtime(full_path), full_path))
-            
-            backups.sort(reverse=True)
-            for _, backup in backups[10:]:
+            while len(self._recent_backups) > self._max_filesystem_backups:
                 try:
-                    os.remove(backup)
-                except:
+                    os.remove(self._recent_backups.popleft())
+                except OSError:
                     pass
                     
         except Exception as e:
             logging.error(f"Ошибка создания резервной копии: {e}")
     
+    @staticmethod
+    def _snapshot_file(source, destination):
+        """Снимок файла: жесткая ссылка, затем copy_file_range, затем shutil.copy2"""
+        # Файл файловой системы всегда заменяется через os.replace, поэтому
+        # жесткая ссылка сохраняет старый inode и не меняется при следующей записи
+        try:
+            os.unlink(destination)
+        except FileNotFoundError:
+            pass
+        
+        try:
+            os.link(source, destination)
+            return
+        except (OSError, AttributeError):
+            # EXDEV, EPERM или ФС без жестких ссылок
+            pass
+        
+        if hasattr(os, 'copy_file_range'):
+            try:
+                with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                    remaining = os.fstat(src.fileno()).st_size
+                    while remaining > 0:
+                        copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                shutil.copystat(source, destination)
+                return
+            except OSError:
+                pass
+        
+        shutil.copy2(source, destination)
+    
+    def _scan_filesystem_backups(self):
+        """Пути бэкапов файловой системы от старых к новым (один проход os.scandir)"""
+        try:
+            with os.scandir(self.backup_dir) as entries:
+                backups = [
+                    (entry.stat().st_mtime, entry.path)
+                    for entry in entries
+                    if entry.name.startswith('filesystem_backup_') and entry.is_file()
+                ]
+        except FileNotFoundError:
+            return []
+        
+        backups.sort()
+        return [path for _, path in backups]
+    
     def _restore_from_backup(self, backup_path):
         """Восстановление из резервной копии"""
         try:
@@ -389,19 +592,21 @@ class SecureVaultCore:
             
             # Дешифруем
             decrypted_data = self.crypto.decrypt_with_master_key(encrypted_data)
-            payload = json.loads(decrypted_data.decode())
-            
-            # Проверяем контрольную сумму
-            data = base64.b64decode(payload['data'])
-            expected_checksum = base64.b64decode(payload['checksum'])
-            actual_checksum = hashlib.sha256(data).digest()
-            
-            if actual_checksum != expected_checksum:
-                raise ValueError("Контрольная сумма не совпадает, данные повреждены")
+            data = _unpack_filesystem_payload(decrypted_data)
             
             # Восстанавливаем файловую систему
-            self.filesystem = json.loads(data.decode())
-            self._save_filesystem()
+            with self._filesystem_lock:
+                self.filesystem = _loads_json(data)
+                self._folder_cache.clear()
+                
+                if decrypted_data[:len(_FILESYSTEM_MAGIC)] == _FILESYSTEM_MAGIC:
+                    # Бэкап уже в текущем формате: шифротекст записывается как есть,
+                    # без повторного шифрования и хеширования
+                    self._atomic_file_operation(
+                        self.filesystem_path, lambda f: f.write(encrypted_data), 'wb', durable=True
+                    )
+                else:
+                    self._save_filesystem()
             
             logging.info(f"Файловая система восстановлена из {backup_path}")
             
@@ -422,38 +627,24 @@ class SecureVaultCore:
                 self._create_default_filesystem()
                 return
             
-            def read_operation(temp_file):
-                encrypted_data = temp_file.read()
-                if len(encrypted_data) == 0:
-                    raise ValueError("Файл пуст")
-                return encrypted_data
+            # Файл заменяется атомарно через os.replace, поэтому читается напрямую
+            with open(self.filesystem_path, 'rb') as f:
+                encrypted_data = f.read()
+            if len(encrypted_data) == 0:
+                raise ValueError("Файл пуст")
             
-            encrypted_data = self._atomic_file_operation(self.filesystem_path, read_operation, 'rb')
             decrypted_data = self.crypto.decrypt_with_master_key(encrypted_data)
             
             try:
-                payload = json.loads(decrypted_data.decode())
-                
-                # Проверяем версию формата
-                if payload.get('version') != '2.0':
-                    raise ValueError("Несовместимая версия файловой системы")
-                
-                # Проверяем контрольную сумму
-                data = base64.b64decode(payload['data'])
-                expected_checksum = base64.b64decode(payload['checksum'])
-                actual_checksum = hashlib.sha256(data).digest()
-                
-                if actual_checksum != expected_checksum:
-                    raise ValueError("Контрольная сумма не совпадает")
-                
-                self.filesystem = json.loads(data.decode())
+                data = _unpack_filesystem_payload(decrypted_data)
+                self.filesystem = _loads_json(data)
                 
             except json.JSONDecodeError:
                 # Старый формат (без контрольной суммы)
-                self.filesystem = json.loads(decrypted_data.decode())
+                self.filesystem = _loads_json(decrypted_data)
             
             self._validate_filesystem_integrity()
-            self._optimize_filesystem_structure()
+            self._folder_cache.clear()
             
         except (json.JSONDecodeError, ValueError, KeyError) as e:
             logging.error(f"Ошибка загрузки файловой системы: {e}")
@@ -461,16 +652,9 @@ class SecureVaultCore:
             
             # Пробуем восстановить из последнего бэкапа
             try:
-                backups = []
-                for f in os.listdir('data/backups'):
-                    if f.startswith('filesystem_backup_'):
-                        full_path = os.path.join('data/backups', f)
-                        backups.append((os.path.getmtime(full_path), full_path))
-                
+                backups = self._scan_filesystem_backups()
                 if backups:
-                    backups.sort(reverse=True)
-                    latest_backup = backups[0][1]
-                    self._restore_from_backup(latest_backup)
+                    self._restore_from_backup(backups[-1])
                 else:
                     self._create_default_filesystem()
             except:
@@ -479,12 +663,16 @@ class SecureVaultCore:
             logging.error(f"Критическая ошибка загрузки файловой системы: {e}")
             self._create_default_filesystem()
     
+    def _data_dir(self):
+        """Директория данных хранилища (рядом с файлом файловой системы)"""
+        return os.path.dirname(self.filesystem_path) or '.'
+    
     def begin_transaction(self, description=""):
         """Начало новой транзакции"""
         return VaultTransaction(self, description)
     
-    def _transactional_add_file(self, file_path, folder_id='root', progress_callback=None):
-        """Добавление файла в рамках транзакции"""
+    def _transactional_add_file(self, file_path, folder_id='root', progress_callback=None, sync=True):
+        """Добавление файла в рамках транзакции (sync=False - без fsync зашифрованного файла)"""
         with self._get_folder_lock(folder_id):
             if folder_id != 'root' and not self.folder_security_manager.is_folder_unlocked(folder_id):
                 raise PermissionError("Папка должна быть разблокирована для добавления файлов")
@@ -499,11 +687,16 @@ class SecureVaultCore:
             try:
                 file_size = os.path.getsize(file_path)
                 if file_size > 10 * 1024 * 1024:
-                    vault_filename, file_id = self.crypto.encrypt_large_file(
-                        file_path, folder_key, progress_callback
+                    vault_filename, file_id, file_hash = self.crypto.encrypt_large_file(
+                        file_path, folder_key, progress_callback, sync, with_hash=True
                     )
                 else:
-                    vault_filename, file_id = self.crypto.encrypt_file(file_path, folder_key, progress_callback)
+                    vault_filename, file_id, file_hash = self.crypto.encrypt_file(
+                        file_path, folder_key, progress_callback, sync, with_hash=True
+                    )
+                
+                # Ключевой хэш зашифрованного файла: проверка целостности без дешифрования
+                file_mac = self.crypto.calculate_file_mac(vault_filename)
                 
                 # Безопасное добавление записи в файловую систему
                 with self._filesystem_lock:
@@ -517,35 +710,43 @@ class SecureVaultCore:
                         'size': file_size,
                         'added_at': self._get_timestamp(),
                         'file_type': self._get_file_type(file_path),
-                        'hash': self.crypto.calculate_file_hash(file_path)
+                        'hash': file_hash,
+                        'mac': file_mac
                     }
                     
                     if folder_id in self.filesystem.get('folders', {}):
                         self.filesystem['folders'][folder_id]['children'].append(file_id)
+                    self._invalidate_folder_cache(folder_id)
                 
                 return file_id
                 
             except Exception as e:
                 if 'vault_filename' in locals() and os.path.exists(vault_filename):
-                    self.crypto._secure_delete(vault_filename)
+                    self.crypto._secure_delete_file(vault_filename)
                 raise e
     
+    def _sync_vault_files(self, file_ids):
+        """Сброс на диск зашифрованных файлов, записанных без синхронизации"""
+        with self._filesystem_lock:
+            files = self.filesystem.get('files', {})
+            paths = [files[file_id]['vault_filename'] for file_id in file_ids if file_id in files]
+        
+        # Синхронизация подряд после всех записей позволяет ФС объединить фиксации журнала
+        datasync = getattr(os, 'fdatasync', os.fsync)
+        for path in paths:
+            try:
+                with open(path, 'rb+') as f:
+                    datasync(f.fileno())
+            except OSError as e:
+                logging.warning(f"Не удалось синхронизировать файл {path}: {e}")
+    
     def add_file(self, file_path, folder_id='root', progress_callback=None):
         """Безопасное добавление файла в хранилище"""
-        return self._queue_operation(
-            self._transactional_add_file,
-            file_path,
-            folder_id,
-            progress_callback
-        )
+        return self._transactional_add_file(file_path, folder_id, progress_callback)
     
     def extract_file(self, file_id, output_dir):
         """Безопасное извлечение файла"""
-        return self._queue_operation(
-            self._transactional_extract_file,
-            file_id,
-            output_dir
-        )
+        return self._transactional_extract_file(file_id, output_dir)
     
     def _transactional_extract_file(self, file_id, output_dir):
         """Извлечение файла в рамках транзакции"""
@@ -569,23 +770,24 @@ class SecureVaultCore:
             if not os.path.exists(vault_path):
                 raise FileNotFoundError(f"Зашифрованный файл не найден: {vault_path}")
             
-            temp_output = self.crypto._create_secure_temp_file()
+            # Расшифровка во временный файл в директории данных хранилища, не в системном /tmp
+            temp_output = SecureTempFile(prefix='extract_', directory=self._data_dir())
             
             try:
-                self.crypto.decrypt_file(vault_path, temp_output, folder_key)
-                
-                extracted_hash = self.crypto.calculate_file_hash(temp_output)
+                extracted_hash = self.crypto.decrypt_file(
+                    vault_path, temp_output.path, folder_key, with_hash=True
+                )
                 if extracted_hash != file_data['hash']:
                     raise ValueError("Целостность файла нарушена: хэши не совпадают")
                 
-                os.replace(temp_output, output_path)
-                temp_output = None
+                os.replace(temp_output.path, output_path)
+                temp_output.path = None
                 
                 return output_path
                 
             finally:
-                if temp_output and os.path.exists(temp_output):
-                    self.crypto._secure_delete(temp_output)
+                if temp_output.path and os.path.exists(temp_output.path):
+                    self.crypto._secure_delete_file(temp_output.path)
     
     def _validate_filesystem_integrity(self):
         """Расширенная проверка целостности файловой системы"""
@@ -594,19 +796,30 @@ class SecureVaultCore:
             if key not in self.filesystem:
                 self.filesystem[key] = {}
         
+        files = self.filesystem['files']
+        folders = self.filesystem['folders']
+        
         # Проверяем ссылочную целостность
-        for file_id, file_data in self.filesystem['files'].items():
-            folder_id = file_data.get('folder_id')
-            if folder_id and folder_id not in self.filesystem['folders']:
-                logging.warning(f"Файл {file_id} ссылается на несуществующую папку {folder_id}")
-                file_data['folder_id'] = 'root'
+        orphan_files = [
+            file_id for file_id, file_data in files.items()
+            if file_data.get('folder_id') and file_data['folder_id'] not in folders
+        ]
+        for file_id in orphan_files:
+            logging.warning(f"Файл {file_id} ссылается на несуществующую папку {files[file_id]['folder_id']}")
+            files[file_id]['folder_id'] = 'root'
         
-        for folder_id, folder_data in self.filesystem['folders'].items():
-            for child_id in list(folder_data.get('children', [])):
-                if (child_id not in self.filesystem['files'] and 
-                    child_id not in self.filesystem['folders']):
+        # Проверка детей - операция над множествами; список пересобирается одним проходом
+        # и только у папок с битыми ссылками
+        known_ids = files.keys() | folders.keys()
+        for folder_id, folder_data in folders.items():
+            children = folder_data.get('children', [])
+            if known_ids.issuperset(children):
+                continue
+            
+            for child_id in children:
+                if child_id not in known_ids:
                     logging.warning(f"Папка {folder_id} содержит несуществующий элемент {child_id}")
-                    folder_data['children'].remove(child_id)
+            folder_data['children'] = [child_id for child_id in children if child_id in known_ids]
     
     def _create_default_filesystem(self):
         """Создание файловой системы по умолчанию"""
@@ -626,6 +839,7 @@ class SecureVaultCore:
             'version': '2.0',
             'created_at': self._get_timestamp()
         }
+        self._folder_cache.clear()
         self._save_filesystem()
     
     def _backup_corrupted_filesystem(self):
@@ -633,9 +847,9 @@ class SecureVaultCore:
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             corrupted_name = f"corrupted_filesystem_{timestamp}.bak"
-            corrupted_path = os.path.join('data/backups', corrupted_name)
+            corrupted_path = os.path.join(self.backup_dir, corrupted_name)
             
-            os.makedirs('data/backups', exist_ok=True)
+            os.makedirs(self.backup_dir, exist_ok=True)
             
             if os.path.exists(self.filesystem_path):
                 shutil.copy2(self.filesystem_path, corrupted_path)
@@ -649,33 +863,16 @@ class SecureVaultCore:
     
     def _get_file_type(self, file_path):
         """Определение типа файла"""
-        import mimetypes
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if mime_type:
-            if mime_type.startswith('image/'):
-                return 'image'
-            elif mime_type.startswith('video/'):
-                return 'video'
-            elif mime_type.startswith('audio/'):
-                return 'audio'
-            elif mime_type in ['application/pdf', 'application/msword', 
-                             'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-                return 'document'
+        file_type = _EXT_TO_FILE_TYPE.get(os.path.splitext(file_path)[1].lower())
+        if file_type:
+            return file_type
         
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext in ['.txt', '.log', '.md', '.json', '.xml', '.html', '.htm']:
-            return 'text'
-        elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz']:
-            return 'archive'
-        else:
-            return 'binary'
+        # Составные расширения (.tgz, .svgz и т.п.) - через mimetypes
+        mime_type, _ = mimetypes.guess_type(file_path)
+        return _file_type_from_mime(mime_type) or 'binary'
     
     def cleanup(self):
         """Очистка ресурсов"""
-        # Сигнал остановки обработчику операций
-        self._operation_queue.put(None)
-        self._operation_worker.join(timeout=5.0)
-        
         # Очистка блокировок
         with self._filesystem_lock:
             self._file_locks.clear()
@@ -683,38 +880,56 @@ class SecureVaultCore:
     
     def verify_integrity(self):
         """Проверка целостности хранилища"""
-        issues = []
+        folder_issues = []
         
         with self._filesystem_lock:
-            # Проверяем файлы
-            for file_id, file_data in self.filesystem.get('files', {}).items():
-                vault_path = file_data.get('vault_filename')
-                if not vault_path or not os.path.exists(vault_path):
-                    issues.append(f"Файл {file_id}: зашифрованный файл не найден")
-                    continue
-                
-                # Проверяем хэш
-                try:
-                    temp_file = self.crypto._create_secure_temp_file()
-                    self.crypto.decrypt_file(vault_path, temp_file, None)
-                    
-                    current_hash = self.crypto.calculate_file_hash(temp_file)
-                    if current_hash != file_data.get('hash'):
-                        issues.append(f"Файл {file_id}: хэш не совпадает")
-                    
-                    # Очистка временного файла
-                    if os.path.exists(temp_file):
-                        self.crypto._secure_delete(temp_file)
-                        
-                except Exception as e:
-                    issues.append(f"Файл {file_id}: ошибка проверки: {e}")
+            files = [
+                (file_id, file_data.get('vault_filename'), file_data.get('hash'), file_data.get('mac'))
+                for file_id, file_data in self.filesystem.get('files', {}).items()
+            ]
             
             # Проверяем папки
             for folder_id, folder_data in self.filesystem.get('folders', {}).items():
                 if folder_id != 'root' and not folder_data.get('parent'):
-                    issues.append(f"Папка {folder_id}: отсутствует родительская папка")
+                    folder_issues.append(f"Папка {folder_id}: отсутствует родительская папка")
+        
+        # Проверяем файлы параллельно: чтение, дешифрование и хэширование отпускают GIL
+        file_issues = []
+        if files:
+            max_workers = min(32, (os.cpu_count() or 1) * 2, len(files))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='verify') as executor:
+                file_issues = [issue for issue in executor.map(self._verify_file, files) if issue]
+        
+        return file_issues + folder_issues
+    
+    def _verify_file(self, entry):
+        """Проверка хэша одного файла (None - проблем нет)"""
+        file_id, vault_path, expected_hash, expected_mac = entry
+        
+        with self._get_file_lock(file_id):
+            if not vault_path or not os.path.exists(vault_path):
+                return f"Файл {file_id}: зашифрованный файл не найден"
+            
+            try:
+                # Ключевой хэш зашифрованного файла проверяется без дешифрования
+                if expected_mac:
+                    algorithm = expected_mac.partition(':')[0]
+                    current_mac = self.crypto.calculate_file_mac(vault_path, algorithm)
+                    if current_mac is not None:
+                        if not hmac.compare_digest(current_mac, expected_mac):
+                            return f"Файл {file_id}: хэш не совпадает"
+                        return None
+                
+                # Прежние записи без ключевого хэша или алгоритм недоступен: дешифрование и SHA-256.
+                # Временный файл с расшифровкой (в директории данных) затирается при выходе из блока
+                with SecureTempFile(prefix='verify_', directory=self._data_dir()) as temp_file:
+                    current_hash = self.crypto.decrypt_file(vault_path, temp_file.path, None, with_hash=True)
+                if current_hash != expected_hash:
+                    return f"Файл {file_id}: хэш не совпадает"
+            except Exception as e:
+                return f"Файл {file_id}: ошибка проверки: {e}"
         
-        return issues
+        return None
 
 # Сохраняем обратную совместимость  
 VaultCore = SecureVaultCore
\ No newline at end of file